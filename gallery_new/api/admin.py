@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import EntityFile, MediaFile, Thumbnail, Token, Quota, VerificationCode
+from .models import EntityFile, MediaFile, Thumbnail, Token, Quota, VerificationCode, Job
 
 admin.site.register(EntityFile)
 admin.site.register(MediaFile)
@@ -16,4 +16,12 @@ class QuotaAdmin(admin.ModelAdmin):
 @admin.register(Token)
 class CustomTokenAdmin(admin.ModelAdmin):
 
-    fields = ['user', 'expires', 'device', 'client']
\ No newline at end of file
+    fields = ['user', 'expires', 'device', 'client']
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+
+    list_display = ['task', 'state', 'attempts', 'run_at', 'updated_at']
+    list_filter = ['state', 'task']
+    readonly_fields = ['attempts', 'last_error', 'created_at', 'updated_at']
@@ -2,32 +2,115 @@ from rest_framework.filters import BaseFilterBackend
 from rest_framework.pagination import LimitOffsetPagination
 from rest_framework.response import Response
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.negotiation import BaseContentNegotiation
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
 
 from .utils.exceptions import MailformedData
 from .models import Token
+from .cache_tokens import TokenCache
 
+from base64 import urlsafe_b64encode, urlsafe_b64decode
 import math
 
 
+def media_type_filter(value: str) -> dict:
+
+    """
+        Indexable media type filter of media_type_prefix parameter
+        Example:
+            image/png - exact match
+            image - media type starts with image
+    """
+
+    if '/' in value:
+        return {'media_type': value}
+    return {'media_type__startswith': value}
+
+
 class CustomPagination(LimitOffsetPagination):
 
-    """ Customised response and parameter names """
+    """
+        Customised response and parameter names
+
+        Cursor mode: client provides cursor parameter (empty for first page)
+        and gets next_cursor in response. Objects are ordered by (-created_at, -id)
+        and every page is selected by index without offset.
+        Total count is returned only if count parameter is provided.
+    """
 
     limit_query_param = 'obj_per_page'
     offset_query_param = 'page'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
     default_limit = 50
 
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = self.cursor_query_param in request.query_params
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.limit = self.get_limit(request)
+        position = self.decode_cursor(request.query_params.get(self.cursor_query_param))
+        queryset = queryset.order_by('-created_at', '-id')
+
+        self.count = None
+        if request.query_params.get(self.count_query_param):
+            self.count = queryset.count()
+
+        if position:
+            created_at, id = position
+            queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=id))
+
+        # one more object shows if there is next page
+        page = list(queryset[:self.limit + 1])
+        self.next_cursor = None
+        if len(page) > self.limit:
+            page = page[:self.limit]
+            self.next_cursor = self.encode_cursor(page[-1])
+        return page
+
     def get_paginated_response(self, data):
-        return Response({
-            'total_pages': self.get_total_pages(),
-            'total_objects': self.count,
+        if not self.use_cursor:
+            return Response({
+                'total_pages': self.get_total_pages(),
+                'total_objects': self.count,
+                'obj_per_page': self.limit,
+                'items': data
+            })
+
+        response = {
+            'next_cursor': self.next_cursor,
             'obj_per_page': self.limit,
             'items': data
-        })
+        }
+        if self.count is not None:
+            response['total_pages'] = self.get_total_pages()
+            response['total_objects'] = self.count
+        return Response(response)
 
     def get_total_pages(self):
         return int(math.ceil(self.count / self.limit))
 
+    def encode_cursor(self, obj) -> str:
+        position = '{}|{}'.format(obj.created_at.isoformat(), obj.id)
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, cursor: str):
+        if not cursor:
+            return None
+        try:
+            created_at, id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+            created_at = parse_datetime(created_at)
+            if not created_at:
+                raise ValueError
+            return created_at, int(id)
+        except ValueError:
+            raise MailformedData
+
 
 class CustomFilterBackend(BaseFilterBackend):
 
@@ -67,7 +150,11 @@ class CustomFilterBackend(BaseFilterBackend):
             value = data.get(parameter)
 
             if value:
-                filter[field] = value
+                # field can be function which returns filter for value
+                if callable(field):
+                    filter.update(field(value))
+                else:
+                    filter[field] = value
 
         return queryset.filter(**filter)
 
@@ -117,6 +204,7 @@ class CustomFilterBackend(BaseFilterBackend):
 
             Example:
                 ('date_gt', 'created_at__gt'),
+                ('media_type', media_type_filter),
         """
 
         if isinstance(parameter, tuple):
@@ -127,9 +215,42 @@ class CustomFilterBackend(BaseFilterBackend):
         return parameter, field
 
 
+class IgnoreAcceptNegotiation(BaseContentNegotiation):
+
+    """
+        Accept header is ignored for file responses,
+        errors are rendered by the first renderer.
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
 class CustomTokenAuth(TokenAuthentication):
 
     """ Custom token model """
 
     model = Token
     keyword = 'Bearer'
+
+    def authenticate_credentials(self, key):
+
+        """ Token and user are cached, expired token is deleted """
+
+        cached_token = TokenCache(key)
+        token = cached_token.get()
+        if token is None:
+            token = self.model.objects.select_related('user').filter(key=key).first()
+            if not token:
+                raise AuthenticationFailed('Invalid token.')
+            cached_token.set(token)
+
+        if not token.check_expires():
+            raise AuthenticationFailed('Token has expired.')
+        if not token.user.is_active:
+            raise AuthenticationFailed('User inactive or deleted.')
+
+        return token.user, token
@@ -0,0 +1,49 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.conf import settings
+
+cache = caches['default']
+
+# stats category / media type prefix
+STATS_CATEGORIES = {
+    'images': 'image',
+    'videos': 'video',
+    'voices': 'voice',
+    'files': 'file',
+}
+
+
+def get_stats_category(media_type: str) -> str:
+    for category, prefix in STATS_CATEGORIES.items():
+        if media_type and media_type.startswith(prefix):
+            return category
+
+
+class UserCacheStats:
+
+    """
+        Cached result of stats_response for user.
+        Deleted on media files changes and computed again by the next request,
+        timeout limits time of inaccuracy if stats computed by concurrent request are cached after deleting.
+        Other processes don't see deleting from LocMem cache, so with LocMem stats are cached for STATS_LOCAL_CACHE_TIMEOUT.
+    """
+
+    def __init__(self, user_id):
+        self.stats_key = 's_{}'.format(user_id)
+
+    @property
+    def stats(self):
+        return cache.get(self.stats_key)
+
+    @stats.setter
+    def stats(self, value):
+        timeout = settings.STATS_CACHE_TIMEOUT
+        if isinstance(cache, LocMemCache):
+            timeout = min(timeout, settings.STATS_LOCAL_CACHE_TIMEOUT)
+        cache.set(self.stats_key, value, timeout=timeout)
+
+    def invalidate(self) -> None:
+
+        """ Called on creating, deleting and resizing of media files """
+
+        cache.delete(self.stats_key)
@@ -0,0 +1,90 @@
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+
+from collections import OrderedDict
+from threading import Lock
+import time
+
+from .models import Token
+
+cache = caches['default']
+
+# In-process LRU: token key / (local expiry time, cached token).
+# Other processes can't invalidate it, so local timeout should be short.
+_tokens = OrderedDict()
+_tokens_lock = Lock()
+
+# Password hash and permissions are not cached, they are loaded from database on access
+USER_FIELDS = ['id', 'username', 'is_active']
+
+
+def use_shared_cache() -> bool:
+    return settings.TOKENS_CACHE_TIMEOUT > 0 and not isinstance(cache, LocMemCache)
+
+
+class TokenCache:
+
+    """
+        Token with user resolved by token key.
+        Cached in process and, if TOKENS_CACHE_TIMEOUT is set, in Django cache, timeout is bounded by token expiration.
+        Invalidated on token deleting and user changes in signals.
+        Deleting from LocMem cache is not seen by other processes, so Django cache is used only with shared backend.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.token_key = 't_{}'.format(key)
+
+    def get(self):
+        with _tokens_lock:
+            expiry, values = _tokens.get(self.key, (0, None))
+            if expiry > time.monotonic():
+                _tokens.move_to_end(self.key)
+            else:
+                values = None
+
+        if values is None:
+            values = cache.get(self.token_key) if use_shared_cache() else None
+            if values is None:
+                return None
+            self._set_local(values)
+        return self._build_token(values)
+
+    def set(self, token: Token) -> None:
+        timeout = (token.expires - timezone.now()).total_seconds()
+        if timeout <= 0:
+            return
+
+        # field values instead of instances, every request gets own objects
+        values = (
+            [getattr(token, field.attname) for field in Token._meta.concrete_fields],
+            [getattr(token.user, field) for field in USER_FIELDS],
+        )
+        if use_shared_cache():
+            cache.set(self.token_key, values, timeout=min(settings.TOKENS_CACHE_TIMEOUT, timeout))
+        self._set_local(values, timeout)
+
+    def delete(self) -> None:
+        cache.delete(self.token_key)
+        with _tokens_lock:
+            _tokens.pop(self.key, None)
+
+    def _set_local(self, values, timeout: float = None) -> None:
+        timeout = min(settings.TOKENS_LOCAL_CACHE_TIMEOUT, timeout or settings.TOKENS_LOCAL_CACHE_TIMEOUT)
+        with _tokens_lock:
+            _tokens[self.key] = (time.monotonic() + timeout, values)
+            _tokens.move_to_end(self.key)
+            while len(_tokens) > settings.TOKENS_LOCAL_CACHE_SIZE:
+                _tokens.popitem(last=False)
+
+    @staticmethod
+    def _build_token(values) -> Token:
+        token_values, user_values = values
+        token = Token.from_db(DEFAULT_DB_ALIAS, [field.attname for field in Token._meta.concrete_fields], token_values)
+        # other fields of user are deferred
+        token.user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, user_values)
+        return token
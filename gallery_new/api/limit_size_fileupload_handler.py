@@ -1,14 +1,23 @@
 import os
+import hashlib
 from django.core.files.uploadedfile import TemporaryUploadedFile
 from django.core.files.uploadhandler import FileUploadHandler, StopUpload
 from django.conf import settings
 from django.urls import reverse
 
+from .models import EntityFile
 from .cache_quota import UserCacheQuota
-from .utils.thumbnails import crop_avatar
+from .utils.thumbnails import get_image_size, get_avatar_size
 from .utils.exceptions import QuotaExceeded, TooManyRequests, LargeFileSize
 
 
+def get_declared_hash(request) -> str:
+
+    """ Hash of uploading file provided by client in header or query parameter """
+
+    return request.META.get('HTTP_X_FILE_HASH') or request.GET.get('hash')
+
+
 class LimitSizeFileUploadHandler(FileUploadHandler):
     file_counter = 0
 
@@ -21,6 +30,7 @@ class LimitSizeFileUploadHandler(FileUploadHandler):
         self.is_avatar = self.request.path == reverse('avatar_upload')
         self.is_image = "image" in self.file.content_type
         self._cache = UserCacheQuota(self.request.user.username, self.user_quota_used)
+        self._hash = hashlib.md5()
 
         if self._cache.files_counter > settings.FILES_LIMIT:
             raise TooManyRequests
@@ -33,6 +43,17 @@ class LimitSizeFileUploadHandler(FileUploadHandler):
             if not self.request.user.quota.quota_available(user=self.request.user, size=self.request_size):
                 raise QuotaExceeded
 
+        # Stop storing file if original file with declared hash already exists.
+        # Rest of body is read and dropped, so client gets response instead of reset connection.
+        # Avatars are cropped after uploading, so they are always received.
+        declared_hash = get_declared_hash(self.request)
+        if declared_hash and not self.is_avatar:
+            entity_file = EntityFile.objects.filter(hash=declared_hash).first()
+            if entity_file:
+                self.request.existing_entity_file = entity_file
+                self.request.existing_file_name = self.file_name
+                raise StopUpload(connection_reset=False)
+
     def receive_data_chunk(self, raw_data, start):
         if len(raw_data) + start + self._cache.quota_used > self.user_quota:
             raise QuotaExceeded
@@ -41,17 +62,23 @@ class LimitSizeFileUploadHandler(FileUploadHandler):
         if len(raw_data) + start + self.user_quota_used > settings.DEFAULT_QUOTA_OVERSIZE + self.user_quota:
             raise QuotaExceeded
         self.file.write(raw_data)
+        self._hash.update(raw_data)
 
     def file_complete(self, file_size):
         self.file.seek(0)
         self.file.size = file_size
         self._cache.quota_used = self.file.size
+        self.file.hash = self._hash.hexdigest()
         os.chmod(self.file.temporary_file_path(), 0o644)
         if self.is_avatar:
             if self.is_image:
+                # avatar is cropped in background job, only image header is read here
                 try:
-                    avatar = crop_avatar(self.file)
-                    self.request.META['max_size'] = avatar.get('max_size')
+                    max_size, cropped = get_avatar_size(
+                        get_image_size(self.file.temporary_file_path()), settings.MAX_AVATAR_SIZE
+                    )
+                    self.request.META['max_size'] = max_size
+                    self.request.META['avatar_crop'] = cropped
                 except:
                     pass
             else:
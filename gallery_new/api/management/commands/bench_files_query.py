@@ -0,0 +1,121 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework.request import Request
+
+from gallery_new.api.models import MediaFile, EntityFile
+from gallery_new.api.backends import CustomFilterBackend
+from gallery_new.api.views import FilesView
+from gallery_new.api.utils.generators import generate_title
+
+from datetime import timedelta
+from itertools import combinations
+import random
+import time
+
+MEDIA_TYPES = ['image/jpeg', 'image/png', 'video/mp4', 'voice/ogg', 'file/pdf', 'application/zip']
+
+# values of FilesView filter parameters
+FILTER_VALUES = {
+    'media_type_prefix': 'image',
+    'date_gte': lambda now: (now - timedelta(days=30)).isoformat(),
+    'date_lte': lambda now: (now - timedelta(days=7)).isoformat(),
+    'size_gte': '100000',
+    'size_lte': '1000000',
+}
+
+
+class Command(BaseCommand):
+
+    help = 'Seed media files and measure FilesView query latency for every filter combination. ' \
+           'Seeded data is rolled back.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000000, help='Number of seeded media files')
+        parser.add_argument('--users', type=int, default=100, help='Seeded files are spread between users')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of every query')
+        parser.add_argument('--page-size', type=int, default=50)
+        parser.add_argument('--explain', action='store_true', help='Print query plans')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users = self.seed(options['rows'], options['users'])
+            self.analyze()
+            self.run_queries(users[0], options)
+
+            # remove seeded data
+            transaction.set_rollback(True)
+
+    def seed(self, rows, users_count):
+        users = [User.objects.create(username='bench_{}@bench'.format(i)) for i in range(users_count)]
+        entity_file = EntityFile.objects.create(file='bench', hash='bench_{}'.format(generate_title()))
+        now = timezone.now()
+
+        # created_at should be spread in time, auto_now_add overrides provided values
+        created_at = MediaFile._meta.get_field('created_at')
+        created_at.auto_now_add = False
+        try:
+            batch = []
+            for i in range(rows):
+                batch.append(MediaFile(
+                    entity_file=entity_file,
+                    user=users[i % users_count],
+                    size=random.randint(1000, 30000000),
+                    media_type=random.choice(MEDIA_TYPES),
+                    name='file_{}'.format(i),
+                    title=generate_title(),
+                    created_at=now - timedelta(seconds=random.randint(0, 3600 * 24 * 365)),
+                    is_avatar=random.random() < 0.05
+                ))
+                if len(batch) == 10000:
+                    MediaFile.objects.bulk_create(batch)
+                    batch = []
+            MediaFile.objects.bulk_create(batch)
+        finally:
+            created_at.auto_now_add = True
+
+        self.stdout.write('Seeded {} media files for {} users'.format(rows, users_count))
+        return users
+
+    def analyze(self):
+        if connection.vendor in ['postgresql', 'sqlite']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE {}'.format(MediaFile._meta.db_table))
+
+    def run_queries(self, user, options):
+        factory = RequestFactory()
+        now = timezone.now()
+        parameters = list(FILTER_VALUES)
+
+        self.stdout.write('{:>10} {:>10} {:>8}  filters'.format('page, ms', 'count, ms', 'rows'))
+        for length in range(len(parameters) + 1):
+            for combination in combinations(parameters, length):
+                query = {
+                    parameter: value(now) if callable(value) else value
+                    for parameter, value in FILTER_VALUES.items() if parameter in combination
+                }
+                request = Request(factory.get('/', query))
+                queryset = CustomFilterBackend().filter_queryset(
+                    request, FilesView.queryset.filter(user=user), FilesView
+                )
+
+                page_time = self.measure(lambda: list(queryset[:options['page_size']]), options['repeat'])
+                count_time = self.measure(queryset.count, options['repeat'])
+                self.stdout.write('{:>10.2f} {:>10.2f} {:>8}  {}'.format(
+                    page_time, count_time, queryset.count(), ', '.join(combination) or '-'
+                ))
+                if options['explain']:
+                    self.stdout.write(queryset[:options['page_size']].explain())
+
+    def measure(self, func, repeat):
+
+        """ Median time of function call in milliseconds """
+
+        times = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append((time.perf_counter() - start) * 1000)
+        return sorted(times)[len(times) // 2]
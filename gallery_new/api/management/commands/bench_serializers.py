@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.request import Request
+
+from gallery_new.api.models import MediaFile, EntityFile, Thumbnail
+from gallery_new.api.serializers import FilesSerializer, AvatarSerializer
+from gallery_new.api.utils import generators
+from gallery_new.api.utils.generators import generate_title
+
+from pathlib import Path
+from unittest import mock
+from urllib.parse import urljoin, urlparse
+import time
+
+
+def get_file_url_legacy(*path):
+
+    """ Previous url builder: path and STATIC_LINK are parsed for every url """
+
+    return urljoin(settings.STATIC_LINK, str(Path(*path)))
+
+
+class Command(BaseCommand):
+
+    help = 'Measure list serialization throughput of files and avatars with previous and current url builders'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=50, help='Items on serialized page')
+        parser.add_argument('--repeat', type=int, default=200, help='Serialized pages')
+
+    def handle(self, *args, **options):
+        items = self.create_items(options['items'])
+        factory = RequestFactory(HTTP_HOST=urlparse(settings.STATIC_LINK).hostname)
+
+        self.stdout.write('{:>12} {:>12}  serializer'.format('legacy, i/s', 'current, i/s'))
+        cases = [
+            ('files', FilesSerializer, {}),
+            ('avatars, static thumbnails', AvatarSerializer, {'AVATAR_THUMBS_LAZY': False}),
+            ('avatars, lazy thumbnails', AvatarSerializer, {'AVATAR_THUMBS_LAZY': True}),
+        ]
+        for name, serializer_class, case_settings in cases:
+            with override_settings(**case_settings):
+                # legacy builder is used by urls of symlinks and avatar thumbnails
+                with mock.patch.object(generators, 'get_file_url', get_file_url_legacy):
+                    legacy = self.measure(serializer_class, items, factory, options['repeat'])
+                current = self.measure(serializer_class, items, factory, options['repeat'])
+            self.stdout.write('{:>12.0f} {:>12.0f}  {}'.format(legacy, current, name))
+
+    def create_items(self, count):
+
+        """ Not saved media files with prefetched thumbnails, database isn't used """
+
+        items = []
+        for i in range(count):
+            entity_file = EntityFile(id=i, hash=generate_title(32))
+            entity_file.avatar_thumbnails = [
+                Thumbnail(entity_file=entity_file, is_avatar=True, side_size=size)
+                for size in settings.THUMBS_SIZE_LIST
+            ]
+            items.append(MediaFile(
+                id=i,
+                entity_file=entity_file,
+                title=generate_title(),
+                name='avatar {}.png'.format(i),
+                size=100000,
+                media_type='image/png',
+                created_at=timezone.now(),
+                is_avatar=True,
+                avatar_thumbs=True
+            ))
+        return items
+
+    def measure(self, serializer_class, items, factory, repeat):
+
+        """ Serialized items per second """
+
+        start = time.perf_counter()
+        for i in range(repeat):
+            # new request for every page, like in view
+            request = Request(factory.get('/'))
+            serializer_class(items, many=True, context={'request': request}).data
+        return len(items) * repeat / (time.perf_counter() - start)
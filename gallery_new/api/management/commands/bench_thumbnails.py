@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageOps
+
+from gallery_new.api.utils.thumbnails import render_image_thumbnails, encode_image
+
+from pathlib import Path
+import tempfile
+import time
+
+
+def render_legacy(path: str, thumb_size: tuple, side_sizes: list) -> dict:
+
+    """ Previous pipeline: image is decoded for every step, sizes are resized from full resolution """
+
+    image = Image.open(path)
+    rendered = {'thumb': encode_image(ImageOps.fit(image, thumb_size), image.format, quality=60)}
+    image = Image.open(path)
+    for size in side_sizes:
+        rendered[size] = encode_image(image.resize((size, size)), 'webp', quality=100, lossless=True, method=1)
+    return rendered
+
+
+class Command(BaseCommand):
+
+    help = 'Compare CPU time of rendering thumbnails for one upload by previous and current pipelines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Source image, synthetic square JPEG is used by default')
+        parser.add_argument('--size', type=int, default=2048, help='Side of synthetic image')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of every pipeline')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            path = options['file']
+            if not path:
+                path = str(Path(directory) / 'bench.jpg')
+                self.create_image(path, options['size'])
+            elif not Path(path).is_file():
+                raise CommandError('File not found: {}'.format(path))
+
+            with Image.open(path) as image:
+                width, height = image.size
+            side_sizes = [size for size in settings.THUMBS_SIZE_LIST if width > size]
+            self.stdout.write('Image {}x{}, avatar sizes: {}'.format(width, height, len(side_sizes)))
+
+            legacy = self.measure(
+                lambda: render_legacy(path, settings.DEFAULT_THUMB_SIZE_TUPLE, side_sizes), options['repeat']
+            )
+            current = self.measure(
+                lambda: render_image_thumbnails(path, settings.DEFAULT_THUMB_SIZE_TUPLE, side_sizes), options['repeat']
+            )
+
+        self.stdout.write('{:>10}  pipeline'.format('cpu, ms'))
+        self.stdout.write('{:>10.2f}  legacy'.format(legacy))
+        self.stdout.write('{:>10.2f}  current'.format(current))
+        self.stdout.write('Speedup: {:.2f}x'.format(legacy / current))
+
+    def create_image(self, path, size):
+        # noise with gradient is closer to photo than plain color
+        noise = Image.effect_noise((size, size), 32)
+        gradient = Image.linear_gradient('L').resize((size, size))
+        Image.merge('RGB', (noise, gradient, gradient.transpose(Image.ROTATE_90))).save(path, quality=90)
+
+    def measure(self, func, repeat):
+
+        """ Median CPU time of function call in milliseconds """
+
+        times = []
+        for i in range(repeat):
+            start = time.process_time()
+            func()
+            times.append((time.process_time() - start) * 1000)
+        return sorted(times)[len(times) // 2]
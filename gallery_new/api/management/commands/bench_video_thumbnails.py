@@ -0,0 +1,103 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageOps, ImageDraw
+
+from gallery_new.api.utils.thumbnails import render_video_thumbnail, encode_image
+
+from pathlib import Path
+import tempfile
+import time
+import av
+
+# codec / container extension
+SAMPLE_CODECS = {
+    'mpeg4': 'mp4',
+    'libx264': 'mp4',
+    'libvpx-vp9': 'webm',
+}
+SAMPLE_SIZES = [(640, 360), (1920, 1080)]
+
+
+def render_legacy(path: str, thumb_size: tuple) -> bytes:
+
+    """ Previous pipeline: first frame is decoded in one thread, full size image is resized """
+
+    container = av.open(path)
+    frame = next(container.decode(video=0))
+    return encode_image(ImageOps.fit(frame.to_image(), thumb_size), 'jpeg', quality=60)
+
+
+class Command(BaseCommand):
+
+    help = 'Compare time of rendering video thumbnail by previous and current pipelines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', action='append', default=[], help='Sample video, can be repeated. '
+                            'By default samples of different codecs and sizes are encoded')
+        parser.add_argument('--duration', type=int, default=10, help='Seconds of encoded samples')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of every pipeline')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = options['file']
+            for path in paths:
+                if not Path(path).is_file():
+                    raise CommandError('File not found: {}'.format(path))
+            if not paths:
+                paths = self.create_samples(directory, options['duration'])
+
+            self.stdout.write('{:>12} {:>12} {:>12} {:>12}  sample'.format(
+                'legacy, ms', 'legacy cpu', 'current, ms', 'current cpu'
+            ))
+            for path in paths:
+                legacy = self.measure(
+                    lambda: render_legacy(path, settings.DEFAULT_THUMB_SIZE_TUPLE), options['repeat']
+                )
+                current = self.measure(
+                    lambda: render_video_thumbnail(path, settings.DEFAULT_THUMB_SIZE_TUPLE), options['repeat']
+                )
+                self.stdout.write('{:>12.2f} {:>12.2f} {:>12.2f} {:>12.2f}  {}'.format(
+                    *legacy, *current, Path(path).name
+                ))
+
+    def create_samples(self, directory, duration):
+        paths = []
+        for codec, extension in SAMPLE_CODECS.items():
+            try:
+                av.codec.Codec(codec, 'w')
+            except Exception:
+                self.stdout.write('Codec is not available: {}'.format(codec))
+                continue
+            for width, height in SAMPLE_SIZES:
+                path = str(Path(directory, '{}_{}x{}.{}'.format(codec, width, height, extension)))
+                self.encode_sample(path, codec, width, height, duration)
+                paths.append(path)
+        return paths
+
+    def encode_sample(self, path, codec, width, height, duration, rate=25):
+        with av.open(path, 'w') as container:
+            stream = container.add_stream(codec, rate=rate)
+            stream.width = width
+            stream.height = height
+            stream.pix_fmt = 'yuv420p'
+            stream.codec_context.gop_size = rate * 2
+
+            for i in range(duration * rate):
+                # moving box, static frames are compressed too well
+                image = Image.new('RGB', (width, height), (i * 2 % 256, 64, 128))
+                ImageDraw.Draw(image).rectangle((i * 8 % width, 0, i * 8 % width + width // 4, height // 2))
+                for packet in stream.encode(av.VideoFrame.from_image(image)):
+                    container.mux(packet)
+            for packet in stream.encode():
+                container.mux(packet)
+
+    def measure(self, func, repeat):
+
+        """ Median wall and CPU time of function call in milliseconds """
+
+        times = []
+        for i in range(repeat):
+            start, start_cpu = time.perf_counter(), time.process_time()
+            func()
+            times.append(((time.perf_counter() - start) * 1000, (time.process_time() - start_cpu) * 1000))
+        return sorted(times)[len(times) // 2]
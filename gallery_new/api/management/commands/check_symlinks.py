@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from gallery_new.api.models import MediaFile, Thumbnail
+from gallery_new.api.utils.simlinks import (
+    get_manifest_paths, read_manifest, compact_manifest, create_symlinks, remove_symlinks, get_symlink_dir
+)
+from gallery_new.api.utils.thumbnails import get_avatar_symlink_name
+
+import os
+
+BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+
+    help = 'Compare media files with symlinks manifests and report missing and stale symlinks. ' \
+           'Symlinks tree is not walked, only manifests of shards are read.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Also check that symlinks of manifests exist on disk'
+        )
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Create missing and lost symlinks, remove stale ones'
+        )
+        parser.add_argument(
+            '--compact', action='store_true',
+            help='Rewrite manifests with current symlinks only'
+        )
+
+    def handle(self, *args, **options):
+        manifests = {path: read_manifest(path) for path in get_manifest_paths()}
+        symlinks = {}
+        for manifest in manifests.values():
+            symlinks.update(manifest)
+
+        titles = set(MediaFile.objects.values_list('title', flat=True).iterator())
+        missing = titles - symlinks.keys()
+        stale = symlinks.keys() - titles
+
+        lost = set()
+        if options['verify'] or options['fix']:
+            for title in titles & symlinks.keys():
+                symlink_dir = get_symlink_dir(title)
+                if not all(os.path.lexists(os.path.join(symlink_dir, name)) for name in symlinks[title]):
+                    lost.add(title)
+
+        self.stdout.write('Media files: {}, missing: {}, stale: {}, lost on disk: {}'.format(
+            len(titles), len(missing), len(stale), len(lost)
+        ))
+
+        if options['fix']:
+            self.create_symlinks(sorted(missing | lost))
+            remove_symlinks(sorted(stale))
+            self.stdout.write('Created symlinks of {} media files, removed {}'.format(len(missing | lost), len(stale)))
+
+        if options['compact']:
+            for path in get_manifest_paths():
+                compact_manifest(path)
+            self.stdout.write('Compacted manifests: {}'.format(len(get_manifest_paths())))
+
+    def create_symlinks(self, titles):
+
+        """ Symlinks of originals and created thumbnails """
+
+        thumbnails = Prefetch('entity_file__thumbnail_set', queryset=Thumbnail.objects.exclude(file=''))
+        for i in range(0, len(titles), BATCH_SIZE):
+            links = []
+            media_files = MediaFile.objects.filter(title__in=titles[i:i + BATCH_SIZE])
+            for media_file in media_files.select_related('entity_file').prefetch_related(thumbnails):
+                links.append((media_file.entity_file.file.path, media_file.name, media_file.title))
+                for thumbnail in media_file.entity_file.thumbnail_set.all():
+                    if not thumbnail.is_avatar:
+                        links.append((thumbnail.file.path, 'thumb_{}'.format(media_file.name), media_file.title))
+                    elif media_file.is_avatar:
+                        links.append((
+                            thumbnail.file.path, get_avatar_symlink_name(media_file, thumbnail.side_size), media_file.title
+                        ))
+            create_symlinks(links)
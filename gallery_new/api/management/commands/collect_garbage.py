@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from gallery_new.api.utils.garbage import collect_garbage
+
+import time
+
+
+class Command(BaseCommand):
+
+    help = 'Delete original files which are not used by media files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.GC_BATCH_SIZE)
+        parser.add_argument(
+            '--grace-period', type=int, default=settings.GC_GRACE_PERIOD,
+            help='Seconds after original file lost the last media file'
+        )
+        parser.add_argument('--max-batches', type=int, default=None, help='Limit work of one run')
+        parser.add_argument(
+            '--interval', type=int, default=0,
+            help='Run as worker, repeat collecting every interval seconds'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            metrics = collect_garbage(
+                batch_size=options['batch_size'],
+                grace_period=options['grace_period'],
+                max_batches=options['max_batches']
+            )
+            self.stdout.write(
+                'Deleted originals: {originals}, thumbnails: {thumbnails}, '
+                'reclaimed bytes: {bytes}, batches: {batches}, seconds: {seconds}'.format(**metrics)
+            )
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import URLError
+from urllib.request import Request, urlopen
+import time
+
+
+class Command(BaseCommand):
+
+    help = 'Send concurrent GET requests to running server and report requests/sec and latency percentiles. ' \
+           'Run it against WSGI and ASGI (ASYNC_VIEWS = True) deployments to compare them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', nargs='+', help='Endpoints, for example http://127.0.0.1:8000/api/v1/files/')
+        parser.add_argument('--token', help='Bearer token of user')
+        parser.add_argument('--concurrency', type=int, default=50, help='Simultaneous clients')
+        parser.add_argument('--requests', type=int, default=1000, help='Requests to every endpoint')
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        headers = {'Authorization': 'Bearer {}'.format(options['token'])} if options['token'] else {}
+
+        self.stdout.write('{:>8} {:>8} {:>8} {:>8} {:>7}  url'.format('rps', 'p50, ms', 'p99, ms', 'max, ms', 'errors'))
+        for url in options['url']:
+            if not url.startswith(('http://', 'https://')):
+                raise CommandError('Wrong url: {}'.format(url))
+
+            def send(i):
+                start = time.perf_counter()
+                try:
+                    with urlopen(Request(url, headers=headers), timeout=options['timeout']) as response:
+                        response.read()
+                        ok = response.status == 200
+                except (URLError, OSError):
+                    ok = False
+                return time.perf_counter() - start, ok
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                results = list(executor.map(send, range(options['requests'])))
+            duration = time.perf_counter() - start
+
+            latencies = sorted(latency * 1000 for latency, ok in results)
+            self.stdout.write('{:>8.1f} {:>8.1f} {:>8.1f} {:>8.1f} {:>7}  {}'.format(
+                len(results) / duration,
+                self.percentile(latencies, 50),
+                self.percentile(latencies, 99),
+                latencies[-1],
+                sum(not ok for latency, ok in results),
+                url
+            ))
+
+    def percentile(self, values, percent):
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from gallery_new.api.models import MediaFileChange
+
+from datetime import timedelta
+
+
+class Command(BaseCommand):
+
+    help = 'Remove changes of media files older than CHANGES_KEEP seconds, clients with older cursors load files list again'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, default=settings.CHANGES_KEEP, help='Seconds to keep changes')
+
+    def handle(self, *args, **options):
+        keep_time = timezone.now() - timedelta(seconds=options['keep'])
+
+        # the last change is kept, it's a lower bound of valid cursors
+        deleted, rows = MediaFileChange.objects.filter(created_at__lt=keep_time).exclude(
+            id=MediaFileChange.get_cursor()
+        ).delete()
+        self.stdout.write('Deleted changes: {}'.format(deleted))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum
+
+from gallery_new.api.models import MediaFile, Quota
+
+
+class Command(BaseCommand):
+
+    help = 'Recompute used quota of all users from media files and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report drift, do not fix quotas'
+        )
+
+    def handle(self, *args, **options):
+
+        # used size of all users in one query
+        used = dict(
+            MediaFile.objects.order_by().values('user').annotate(used=Sum('size')).values_list('user', 'used')
+        )
+
+        drifted = 0
+        for quota in Quota.objects.select_related('user').iterator():
+            if (quota.used or 0) == used.get(quota.user_id, 0):
+                continue
+
+            if options['dry_run']:
+                actual = used.get(quota.user_id, 0)
+            else:
+                # recompute under lock, files could be changed after first query
+                with transaction.atomic():
+                    quota = Quota.objects.select_for_update().select_related('user').get(id=quota.id)
+                    actual = quota.get_quota_used()
+                    if quota.used == actual:
+                        continue
+                    Quota.objects.filter(id=quota.id).update(used=actual)
+                    Quota.change_version([quota.user_id])
+
+            drifted += 1
+            self.stdout.write('{}: {} -> {} ({:+})'.format(
+                quota.user.username, quota.used, actual, actual - (quota.used or 0)
+            ))
+
+        self.stdout.write('Quotas with drift: {}'.format(drifted))
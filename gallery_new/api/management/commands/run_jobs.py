@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+
+from gallery_new.api.utils.jobs import run_worker
+
+
+class Command(BaseCommand):
+
+    help = 'Run background jobs worker (thumbnails etc.)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=settings.JOBS_WORKERS,
+            help='Max number of jobs running simultaneously'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=settings.JOBS_POLL_INTERVAL,
+            help='Seconds between checks of the queue'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Stop when there are no pending jobs'
+        )
+
+    def handle(self, *args, **options):
+        processed = run_worker(
+            workers=options['workers'],
+            poll_interval=options['poll_interval'],
+            once=options['once']
+        )
+        self.stdout.write('Processed jobs: {}'.format(processed))
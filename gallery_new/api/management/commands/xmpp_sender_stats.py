@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from gallery_new.api.utils.xmpp_sender import get_metrics
+
+
+class Command(BaseCommand):
+
+    help = 'Print delivery counters of verification codes sender. ' \
+           'Counters of all processes are shown only with shared cache backend (memcached, redis)'
+
+    def handle(self, *args, **options):
+        for name, value in get_metrics().items():
+            self.stdout.write('{}: {}'.format(name, value))
@@ -0,0 +1,35 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django_jsonfield_backport.models
+import gallery_new.api.utils.generators
+import gallery_new.api.utils.validators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0002_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UploadSession',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('session_id', models.CharField(default=gallery_new.api.utils.generators.generate_uuid, editable=False, max_length=255, unique=True)),
+                ('name', models.CharField(max_length=255)),
+                ('media_type', models.CharField(max_length=255, validators=[gallery_new.api.utils.validators.MimeTypeValidator()])),
+                ('size', models.IntegerField()),
+                ('offset', models.IntegerField(default=0)),
+                ('metadata', django_jsonfield_backport.models.JSONField(blank=True, null=True)),
+                ('create_thumbnails', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
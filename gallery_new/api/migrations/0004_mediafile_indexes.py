@@ -0,0 +1,25 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(condition=models.Q(is_avatar=False), fields=['user', '-created_at', '-id'], name='api_mediafile_files_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(condition=models.Q(is_avatar=False), fields=['user', 'media_type', '-created_at', '-id'], name='api_mediafile_type_idx', opclasses=['', 'varchar_pattern_ops', '', '']),
+        ),
+        migrations.AddIndex(
+            model_name='mediafile',
+            index=models.Index(condition=models.Q(is_avatar=False), fields=['user', 'size'], name='api_mediafile_size_idx'),
+        ),
+    ]
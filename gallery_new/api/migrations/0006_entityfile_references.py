@@ -0,0 +1,36 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:51
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+import django.utils.timezone
+
+
+def count_references(apps, schema_editor):
+    EntityFile = apps.get_model('api', 'EntityFile')
+    MediaFile = apps.get_model('api', 'MediaFile')
+
+    references = MediaFile.objects.filter(entity_file=models.OuterRef('pk')).order_by()\
+        .values('entity_file').annotate(count=models.Count('id')).values('count')
+    EntityFile.objects.update(ref_count=Coalesce(models.Subquery(references), 0))
+    EntityFile.objects.filter(ref_count__gt=0).update(orphaned_at=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_mediafile_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entityfile',
+            name='orphaned_at',
+            field=models.DateTimeField(blank=True, db_index=True, default=django.utils.timezone.now, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='entityfile',
+            name='ref_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.14 on 2026-10-18 17:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_entityfile_references'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thumbnail',
+            name='accessed_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='thumbnail',
+            name='size',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
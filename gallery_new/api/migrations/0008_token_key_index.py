@@ -0,0 +1,19 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:00
+
+from django.db import migrations, models
+import gallery_new.api.utils.generators
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_thumbnail_lazy'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='token',
+            name='key',
+            field=models.CharField(db_index=True, default=gallery_new.api.utils.generators.generate_uuid, editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_token_key_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='quota',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddField(
+            model_name='quota',
+            name='version',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+    ]
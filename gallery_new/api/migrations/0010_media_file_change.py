@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:11
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0009_quota_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFileChange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('media_file_id', models.IntegerField()),
+                ('is_avatar', models.BooleanField(default=False)),
+                ('action', models.CharField(choices=[('created', 'Created'), ('deleted', 'Deleted')], max_length=16)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='mediafilechange',
+            index=models.Index(fields=['user', 'is_avatar', 'id'], name='api_mediafi_user_id_3cb53f_idx'),
+        ),
+    ]
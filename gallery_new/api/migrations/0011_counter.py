@@ -0,0 +1,39 @@
+# Generated by Django 3.1.14 on 2026-10-18 18:20
+
+from django.db import migrations, models
+
+
+def count_avatar_thumbs(apps, schema_editor):
+    Counter = apps.get_model('api', 'Counter')
+    Thumbnail = apps.get_model('api', 'Thumbnail')
+
+    # size of thumbnails stored before 0007 is 0, they would be left out of AVATAR_THUMBS_CACHE_SIZE
+    for thumbnail in Thumbnail.objects.filter(size=0).exclude(file='').iterator():
+        try:
+            size = thumbnail.file.size
+        except OSError:
+            # file is lost, it's not counted
+            continue
+        Thumbnail.objects.filter(id=thumbnail.id).update(size=size)
+
+    used = Thumbnail.objects.filter(is_avatar=True).exclude(file='').aggregate(used=models.Sum('size'))['used']
+    Counter.objects.create(name='avatar_thumbs_used', value=used or 0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_media_file_change'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Counter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_avatar_thumbs, migrations.RunPython.noop),
+    ]
@@ -1,9 +1,12 @@
 from django.db import models
+from django.db.models.functions import Coalesce
 from django_jsonfield_backport.models import JSONField
 from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth.models import User
 
+from datetime import timedelta
+
 from .utils.generators import get_upload_entity, get_upload_thumb, get_token_lifetime, get_code_lifetime, generate_uuid, generate_title
 from .utils.validators import MimeTypeValidator
 
@@ -19,6 +22,9 @@ class EntityFile(models.Model):
         blank=True,
         null=True
     )
+    # number of media files, original file without them is removed by collect_garbage
+    ref_count = models.IntegerField(default=0, editable=False)
+    orphaned_at = models.DateTimeField(default=timezone.now, null=True, blank=True, editable=False, db_index=True)
 
     def __str__(self):
         return self.get_filename()
@@ -26,9 +32,53 @@ class EntityFile(models.Model):
     def get_filename(self):
         return os.path.basename(self.file.file.name)
 
+    @classmethod
+    def change_refs(cls, ids, count):
+
+        """
+            Atomic change of reference count.
+            Original file is marked as orphaned when it has no references
+        """
+
+        now = timezone.now()
+        cls.objects.filter(id__in=ids).update(
+            # condition uses value before update: MySQL applies SET left to right,
+            # so orphaned_at is set before ref_count (keyword order is kept in query)
+            orphaned_at=models.Case(
+                models.When(ref_count__lte=-count, then=models.Value(now)),
+                default=models.Value(None),
+                output_field=models.DateTimeField()
+            ),
+            ref_count=models.F('ref_count') + count
+        )
+
 
 class MediaFile(models.Model):
 
+    class Meta:
+        # Indexes for FilesView filters and ordering, avatars are found by user_id index.
+        # is_avatar=False is compiled to NOT is_avatar, it's not an equality and is used only as partial index condition.
+        # media_type is prefix matched, varchar_pattern_ops is required by LIKE 'image%' on PostgreSQL
+        # (opclasses are ignored by other databases)
+        indexes = [
+            models.Index(
+                fields=['user', '-created_at', '-id'],
+                name='api_mediafile_files_idx',
+                condition=models.Q(is_avatar=False)
+            ),
+            models.Index(
+                fields=['user', 'media_type', '-created_at', '-id'],
+                name='api_mediafile_type_idx',
+                condition=models.Q(is_avatar=False),
+                opclasses=['', 'varchar_pattern_ops', '', '']
+            ),
+            models.Index(
+                fields=['user', 'size'],
+                name='api_mediafile_size_idx',
+                condition=models.Q(is_avatar=False)
+            ),
+        ]
+
     entity_file = models.ForeignKey(EntityFile, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     avatar_thumbs = models.BooleanField(default=False)
@@ -57,6 +107,9 @@ class Thumbnail(models.Model):
     file = models.FileField(upload_to=get_upload_thumb)
     is_avatar = models.BooleanField(default=False)
     side_size = models.IntegerField(default=settings.DEFAULT_THUMB_SIZE_TUPLE[0])
+    size = models.IntegerField(default=0, editable=False)
+    # last request of lazy avatar thumbnail
+    accessed_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     def __str__(self):
         return self.get_filename()
@@ -65,6 +118,27 @@ class Thumbnail(models.Model):
         return os.path.basename(self.file.file.name)
 
 
+class Counter(models.Model):
+
+    """ Named counter changed atomically by F() updates instead of aggregating tables """
+
+    name = models.CharField(max_length=64, unique=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def change(cls, name, value):
+        if not cls.objects.filter(name=name).update(value=models.F('value') + value):
+            cls.objects.get_or_create(name=name)
+            cls.objects.filter(name=name).update(value=models.F('value') + value)
+
+    @classmethod
+    def get_value(cls, name):
+        return cls.objects.filter(name=name).values_list('value', flat=True).first() or 0
+
+
 class Quota(models.Model):
     class Meta:
         ordering = ['user__username']
@@ -73,6 +147,9 @@ class Quota(models.Model):
 
     size = models.IntegerField(default=0, null=True, blank=True)
     used = models.IntegerField(default=0, null=True, blank=True, editable=False)
+    # gallery version for conditional requests, increased on every change of files or quota
+    version = models.BigIntegerField(default=0, editable=False)
+    modified_at = models.DateTimeField(default=timezone.now, editable=False)
 
     @property
     def get_size(self):
@@ -87,11 +164,30 @@ class Quota(models.Model):
 
     def update_quota_used(self):
         self.used = self.get_quota_used()
-        self.save()
+        self.save(update_fields=['used'])
 
     def update_quota_value(self, value):
         self.size = value
-        self.save()
+        self.save(update_fields=['size'])
+        Quota.change_version([self.user_id])
+
+    @classmethod
+    def change_used(cls, user_id, size):
+
+        """ Atomic increase (or decrease with negative size) of used quota """
+
+        cls.objects.filter(user_id=user_id).update(
+            used=Coalesce(models.F('used'), 0) + size,
+            version=models.F('version') + 1,
+            modified_at=timezone.now()
+        )
+
+    @classmethod
+    def change_version(cls, user_ids):
+
+        """ Mark galleries of users as changed without changing used quota """
+
+        cls.objects.filter(user_id__in=user_ids).update(version=models.F('version') + 1, modified_at=timezone.now())
 
     def quota_available(self, size):
         return int(size) < (self.get_size - self.used)
@@ -102,7 +198,7 @@ class Quota(models.Model):
 
 class Token(models.Model):
 
-    key = models.CharField(max_length=255, editable=False, default=generate_uuid)
+    key = models.CharField(max_length=255, editable=False, default=generate_uuid, db_index=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     device = models.CharField(max_length=255, null=True, blank=True)
     client = models.CharField(max_length=255, null=True, blank=True)
@@ -112,6 +208,12 @@ class Token(models.Model):
     def __str__(self):
         return self.user.username
 
+    def check_expires(self):
+        if timezone.now() > self.expires:
+            self.delete()
+            return False
+        return True
+
 
 class VerificationCode(models.Model):
     value = models.IntegerField(blank=True, unique=True, null=True)
@@ -126,3 +228,129 @@ class VerificationCode(models.Model):
             self.delete()
             return False
         return True
+
+
+class UploadSession(models.Model):
+
+    """ Resumable upload. Received chunks are written to staging file """
+
+    session_id = models.CharField(max_length=255, unique=True, editable=False, default=generate_uuid)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+    media_type = models.CharField(
+        max_length=255,
+        validators=[MimeTypeValidator()]
+    )
+    size = models.IntegerField()
+    offset = models.IntegerField(default=0)
+    metadata = JSONField(blank=True, null=True)
+    create_thumbnails = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # finished session is kept until expiration, retried finish returns created media file.
+    # Not a foreign key, media files are deleted without collecting related rows
+    finished_at = models.DateTimeField(blank=True, null=True)
+    media_file_id = models.IntegerField(blank=True, null=True)
+
+    def __str__(self):
+        return self.session_id
+
+    def get_staging_path(self):
+        return os.path.join(settings.MEDIA_ROOT, settings.UPLOAD_SESSIONS_DIR, self.session_id)
+
+
+class Job(models.Model):
+
+    """ Background job persisted in database and executed by run_jobs workers """
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    class Meta:
+        ordering = ['run_at']
+        indexes = [
+            models.Index(fields=['state', 'run_at']),
+        ]
+
+    task = models.CharField(max_length=255)
+    kwargs = JSONField(default=dict, blank=True)
+    state = models.CharField(max_length=16, choices=STATES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    run_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return '{} ({})'.format(self.task, self.state)
+
+
+class MediaFileChange(models.Model):
+
+    """
+        Log of created and deleted media files for delta sync.
+        Id of the last change is a cursor of client, old changes are removed by prune_changes command.
+    """
+
+    CREATED = 'created'
+    DELETED = 'deleted'
+
+    ACTIONS = [
+        (CREATED, 'Created'),
+        (DELETED, 'Deleted'),
+    ]
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_avatar', 'id']),
+        ]
+
+    # changes are kept after deleting of user until they are pruned
+    user = models.ForeignKey(User, on_delete=models.DO_NOTHING, db_constraint=False)
+    media_file_id = models.IntegerField()
+    is_avatar = models.BooleanField(default=False)
+    action = models.CharField(max_length=16, choices=ACTIONS)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return '{} {}'.format(self.action, self.media_file_id)
+
+    @classmethod
+    def get_cursor(cls):
+
+        """ Id of the last change of all users """
+
+        return cls.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+    @classmethod
+    def get_settled_cursor(cls):
+
+        """
+            Id of the last change that is safe to return.
+            Ids are taken on insert, but transactions commit in another order,
+            so change with smaller id can become visible later. Changes younger than CHANGES_SETTLE seconds
+            and all changes after them are held back.
+        """
+
+        settle_time = timezone.now() - timedelta(seconds=settings.CHANGES_SETTLE)
+        unsettled = cls.objects.filter(created_at__gt=settle_time).order_by('id').values_list('id', flat=True).first()
+        if unsettled is not None:
+            return unsettled - 1
+        return cls.get_cursor()
+
+    @classmethod
+    def is_expired(cls, cursor):
+
+        """ Changes after cursor could be pruned """
+
+        oldest = cls.objects.order_by('id').values_list('id', flat=True).first()
+        return oldest is not None and cursor + 1 < oldest
@@ -1,11 +1,11 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from django.conf import settings
-from pathlib import Path
+from django.utils.functional import cached_property
 
-from .models import MediaFile, EntityFile, Token
+from .models import MediaFile, EntityFile, Token, UploadSession
 from .utils.validators import MimeTypeValidator
-from .utils.generators import get_file_url
+from .utils.generators import get_symlink_url, get_avatar_thumbnail_url, get_avatar_thumbnails_url
 
 
 class SlotSerializer(serializers.HyperlinkedModelSerializer):
@@ -31,14 +31,14 @@ class FilesSerializer(serializers.HyperlinkedModelSerializer):
         fields = ['id', 'size', 'media_type', 'name', 'slot_id', 'file', 'created_at', 'hash', 'thumbnail']
 
     def get_file_url(self, media_file):
-        return get_file_url(media_file.title, media_file.name)
+        return get_symlink_url(media_file.title, media_file.name)
 
     def get_thumbnail(self, media_file, *args, **kwargs):
 
         """ Customize thumbnail field """
 
         thumbnail_info = {
-            'url': get_file_url(media_file.title, 'thumb_%s' % media_file.name),
+            'url': get_symlink_url(media_file.title, 'thumb_%s' % media_file.name),
             'width': settings.DEFAULT_THUMB_SIZE_TUPLE[0],
             'height': settings.DEFAULT_THUMB_SIZE_TUPLE[1],
         }
@@ -58,19 +58,30 @@ class AvatarSerializer(FilesSerializer):
         model = MediaFile
         fields = ['id', 'size', 'media_type', 'name', 'slot_id', 'file', 'created_at', 'hash', 'thumbnail', 'thumbnails', 'is_avatar']
 
+    @cached_property
+    def thumbnails_url(self):
+        # one serializer instance is used for all items of list
+        return get_avatar_thumbnails_url(self.context.get('request'))
+
     def get_thumbnails(self, media_file, *args, **kwargs):
 
         """ Customize thumbnails field """
 
         thumbnails_info = []
         if media_file.avatar_thumbs:
-            thumb_name = Path(media_file.name).stem
+            # thumbnails are prefetched in AvatarView
+            thumbnails = getattr(media_file.entity_file, 'avatar_thumbnails', None)
+            if thumbnails is None:
+                thumbnails = media_file.entity_file.thumbnail_set.filter(is_avatar=True)
+
             thumbnails_info = [
                 {
-                    'url': get_file_url(media_file.title, '%s_%s.webp' % (thumbnail.side_size, thumb_name)),
+                    'url': get_avatar_thumbnail_url(
+                        self.thumbnails_url, media_file.title, media_file.name, thumbnail.side_size
+                    ),
                     'width': thumbnail.side_size,
                     'height': thumbnail.side_size,
-                } for thumbnail in media_file.entity_file.thumbnail_set.filter(is_avatar=True)
+                } for thumbnail in thumbnails
             ]
         return thumbnails_info
 
@@ -78,6 +89,8 @@ class AvatarSerializer(FilesSerializer):
 class FilesUploadSerializer(serializers.HyperlinkedModelSerializer):
 
     hash = serializers.ReadOnlyField()
+    # file can be skipped by upload handler if it already exists
+    file = serializers.FileField(required=False)
     media_type = serializers.CharField(help_text=u'Example: image/png', validators=[MimeTypeValidator()])
     size = serializers.IntegerField(required=False)
     create_thumbnails = serializers.BooleanField(default=True)
@@ -88,6 +101,21 @@ class FilesUploadSerializer(serializers.HyperlinkedModelSerializer):
         fields = ['file', 'size', 'hash', 'media_type', 'create_thumbnails', 'metadata',]
 
 
+class UploadSessionSerializer(serializers.HyperlinkedModelSerializer):
+
+    session_id = serializers.ReadOnlyField()
+    offset = serializers.ReadOnlyField()
+    name = serializers.CharField(required=True)
+    size = serializers.IntegerField(required=True, min_value=1)
+    media_type = serializers.CharField(help_text=u'Example: video/mp4', validators=[MimeTypeValidator()])
+    create_thumbnails = serializers.BooleanField(default=True)
+    metadata = serializers.JSONField(required=False)
+
+    class Meta:
+        model = UploadSession
+        fields = ['session_id', 'name', 'size', 'offset', 'media_type', 'create_thumbnails', 'metadata']
+
+
 class XmppCodeSerializer(serializers.Serializer):
 
     jid = serializers.CharField(required=True)
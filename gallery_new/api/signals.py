@@ -1,32 +1,40 @@
-from gallery_new.api.models import MediaFile, EntityFile, Quota, Thumbnail
+from gallery_new.api.models import MediaFile, EntityFile, Quota, Thumbnail, UploadSession, Token, MediaFileChange,\
+    Counter
 from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 from django.conf import settings
 from django.contrib.auth.models import User
 
+from .cache_stats import UserCacheStats
+from .cache_tokens import TokenCache, USER_FIELDS
 from .utils.generators import hash_md5
-from .utils.simlinks import create_symlink
-from .utils.other import delete_files, update_quota
+from .utils.simlinks import create_symlink, remove_symlinks
+from .utils.thumbnails import AVATAR_THUMBS_USED
+from .utils.uploads import delete_staging_file
 
-from threading import Thread
-
-from pathlib import Path
-from shutil import rmtree
 from mimetypes import guess_type
 
 
 @receiver(post_save, sender=MediaFile)
 def media_file_post_save(*args, **kwargs):
 
-    """ Create symlinks on media file creating """
+    """ Create symlinks on media file creating and record change for delta sync """
 
     media_file = kwargs.get('instance')
     created = kwargs.get('created')
 
     if created:
-        # update quota and create symlink
-        Thread(target=update_quota, args=(media_file,)).start()
+        # update quota, stats, references and create symlink
+        Quota.change_used(media_file.user_id, media_file.size)
+        EntityFile.change_refs([media_file.entity_file_id], 1)
+        UserCacheStats(media_file.user_id).invalidate()
         create_symlink(media_file.entity_file.file.path, media_file.name, media_file.title)
+        MediaFileChange.objects.create(
+            user_id=media_file.user_id,
+            media_file_id=media_file.id,
+            is_avatar=media_file.is_avatar,
+            action=MediaFileChange.CREATED
+        )
 
 
 @receiver(pre_save, sender=MediaFile)
@@ -48,20 +56,23 @@ def media_file_pre_save(*args, **kwargs):
 @receiver(post_delete, sender=MediaFile)
 def media_file_post_delete(*args, **kwargs):
 
-    """ Delete related files """
+    """ Delete related files and record change for delta sync """
 
     media_file = kwargs.get('instance')
 
-    # update quota
-    Thread(target=update_quota, args=(media_file,)).start()
-
-    symlink_path = str(Path(settings.MEDIA_ROOT, settings.SYMLINKS_DIR, media_file.title))
-    try:
-        rmtree(symlink_path)
-    except:
-        pass
+    # update quota, stats and references
+    # original file is deleted by collect_garbage command
+    Quota.change_used(media_file.user_id, -media_file.size)
+    EntityFile.change_refs([media_file.entity_file_id], -1)
+    UserCacheStats(media_file.user_id).invalidate()
 
-    Thread(target=delete_files).start()
+    remove_symlinks([media_file.title])
+    MediaFileChange.objects.create(
+        user_id=media_file.user_id,
+        media_file_id=media_file.id,
+        is_avatar=media_file.is_avatar,
+        action=MediaFileChange.DELETED
+    )
 
 
 @receiver(pre_save, sender=EntityFile)
@@ -72,11 +83,16 @@ def entity_file_pre_save(*args, **kwargs):
     instance = kwargs.get('instance')
 
     # Generate hash if it's not provided.
+    # Uploaded files already have hash computed by LimitSizeFileUploadHandler.
     # WARNING: It's better to provide hash in view.
     # That method can take a lot of time to upload file from storage.
     if not instance.hash:
-        file = open(instance.file.path, 'rb')
-        instance.hash = hash_md5(file)
+        file = instance.file.file
+        instance.hash = getattr(file, 'hash', None)
+        if not instance.hash:
+            file.seek(0)
+            instance.hash = hash_md5(file)
+            file.seek(0)
 
 
 @receiver(post_delete, sender=EntityFile)
@@ -95,8 +111,19 @@ def thumbnail_post_delete(*args, **kwargs):
     """ Delete thumbnails from storage"""
 
     thumbnail = kwargs.get('instance')
-    if thumbnail.file.storage.exists(thumbnail.file.name):
+    # lazy avatar thumbnail could be not rendered yet
+    if thumbnail.file and thumbnail.file.storage.exists(thumbnail.file.name):
         thumbnail.file.storage.delete(thumbnail.file.name)
+    if thumbnail.is_avatar and thumbnail.file:
+        Counter.change(AVATAR_THUMBS_USED, -thumbnail.size)
+
+
+@receiver(post_delete, sender=UploadSession)
+def upload_session_post_delete(*args, **kwargs):
+
+    """ Delete staging file of resumable upload """
+
+    delete_staging_file(kwargs.get('instance'))
 
 
 @receiver(post_save, sender=User)
@@ -106,6 +133,20 @@ def user_post_save(*args, **kwargs):
 
     created = kwargs.get('created')
     user = kwargs.get('instance')
+    update_fields = kwargs.get('update_fields')
 
     if created:
         Quota.objects.create(user=user)
+    elif update_fields is None or set(update_fields) & set(USER_FIELDS):
+        # cached tokens contain user, last_login updates don't change it
+        for key in Token.objects.filter(user=user).values_list('key', flat=True):
+            TokenCache(key).delete()
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_post_change(*args, **kwargs):
+
+    """ Invalidate cached token """
+
+    TokenCache(kwargs.get('instance').key).delete()
@@ -0,0 +1,133 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test.utils import override_settings, CaptureQueriesContext
+from django.db import connection
+from django.apps import apps
+
+from gallery_new.api.models import MediaFile, EntityFile, Quota, Thumbnail, Counter
+from gallery_new.api.utils.generators import hash_md5
+from gallery_new.api.utils.simlinks import get_symlinks_root, get_symlink_dir, create_symlink, read_manifest, \
+    append_manifest, compact_manifest, lock_manifest
+
+from importlib import import_module
+from io import StringIO
+from pathlib import Path
+from shutil import rmtree
+from threading import Thread
+import os
+import tempfile
+
+
+class TestCommands(TestCase):
+
+    def setUp(self):
+        self.user, created = User.objects.get_or_create(username='test@test')
+        file = ContentFile(b'test file', 'test.txt')
+        self.entity_file = EntityFile.objects.create(file=file, hash=hash_md5(file))
+        self.media_file = MediaFile.objects.create(
+            entity_file=self.entity_file,
+            media_type='text/plain',
+            name=file.name,
+            user=self.user
+        )
+
+    def test_reconcile_quota(self):
+        Quota.objects.filter(user=self.user).update(used=100)
+
+        out = StringIO()
+        call_command('reconcile_quota', '--dry-run', stdout=out)
+        self.assertIn('test@test: 100 -> 9 (-91)', out.getvalue())
+        self.assertEqual(Quota.objects.get(user=self.user).used, 100)
+
+        call_command('reconcile_quota', stdout=out)
+        self.assertEqual(Quota.objects.get(user=self.user).used, 9)
+
+    def test_change_refs(self):
+        # MySQL applies SET left to right, condition of orphaned_at must see ref_count before update
+        with CaptureQueriesContext(connection) as queries:
+            EntityFile.change_refs([self.entity_file.id], -1)
+        sql = queries[-1]['sql']
+        self.assertLess(sql.index('"orphaned_at" ='), sql.index('"ref_count" ='))
+
+        self.entity_file.refresh_from_db()
+        self.assertEqual(self.entity_file.ref_count, 0)
+        self.assertIsNotNone(self.entity_file.orphaned_at)
+
+    def test_count_avatar_thumbs_migration(self):
+        # thumbnails stored before size field have size 0
+        thumbnail = Thumbnail.objects.create(
+            entity_file=self.entity_file, file=ContentFile(b'thumbnail', 'thumb.webp'), side_size=32, is_avatar=True
+        )
+        Thumbnail.objects.filter(id=thumbnail.id).update(size=0)
+        Counter.objects.all().delete()
+
+        import_module('gallery_new.api.migrations.0011_counter').count_avatar_thumbs(apps, None)
+        thumbnail.refresh_from_db()
+        self.assertEqual(thumbnail.size, 9)
+        self.assertEqual(Counter.get_value('avatar_thumbs_used'), 9)
+
+    def test_collect_garbage(self):
+        self.entity_file.refresh_from_db()
+        self.assertEqual(self.entity_file.ref_count, 1)
+        self.assertIsNone(self.entity_file.orphaned_at)
+
+        file = ContentFile(b'orphan', 'orphan.txt')
+        orphan = EntityFile.objects.create(file=file, hash=hash_md5(file))
+        MediaFile.objects.create(entity_file=orphan, name=file.name, user=self.user).delete()
+
+        out = StringIO()
+        call_command('collect_garbage', stdout=out)
+        self.assertTrue(EntityFile.objects.filter(id=orphan.id).exists())
+
+        call_command('collect_garbage', '--grace-period', '0', stdout=out)
+        self.assertIn('Deleted originals: 1, thumbnails: 0, reclaimed bytes: 6', out.getvalue())
+        self.assertFalse(EntityFile.objects.filter(id=orphan.id).exists())
+        self.assertTrue(EntityFile.objects.filter(id=self.entity_file.id).exists())
+
+    def test_check_symlinks(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(rmtree, media_root)
+
+        with override_settings(MEDIA_ROOT=media_root, SYMLINKS_SHARD_DEPTH=2):
+            media_file = MediaFile.objects.create(entity_file=self.entity_file, name='sharded.txt', user=self.user)
+            title = media_file.title
+            symlink_dir = Path(get_symlinks_root(), title[:2], title[2:4], title)
+            self.assertEqual(get_symlink_dir(title), symlink_dir)
+            self.assertTrue(Path(symlink_dir, 'sharded.txt').is_symlink())
+
+            # symlink of deleted media file and symlink lost on disk
+            create_symlink(self.entity_file.file.path, 'stale.txt', 'STALEtitle00')
+            os.unlink(Path(symlink_dir, 'sharded.txt'))
+
+            out = StringIO()
+            call_command('check_symlinks', '--verify', stdout=out)
+            # media file of setUp was created in another layout
+            self.assertIn('Media files: 2, missing: 1, stale: 1, lost on disk: 1', out.getvalue())
+
+            call_command('check_symlinks', '--fix', '--compact', stdout=out)
+            self.assertTrue(Path(symlink_dir, 'sharded.txt').is_symlink())
+            self.assertTrue(get_symlink_dir(self.media_file.title).exists())
+            self.assertFalse(get_symlink_dir('STALEtitle00').exists())
+            self.assertEqual(
+                read_manifest(Path(get_symlinks_root(), title[:2], '.manifest')), {title: {'sharded.txt'}}
+            )
+
+            out = StringIO()
+            call_command('check_symlinks', '--verify', stdout=out)
+            self.assertIn('Media files: 2, missing: 0, stale: 0, lost on disk: 0', out.getvalue())
+
+            media_file.delete()
+            self.assertFalse(symlink_dir.exists())
+            manifest_path = Path(get_symlinks_root(), title[:2], '.manifest')
+            self.assertNotIn(title, read_manifest(manifest_path))
+
+            # append waits for compaction and is not lost
+            with lock_manifest(manifest_path):
+                thread = Thread(target=append_manifest, args=([['+', title, 'appended.txt']],))
+                thread.start()
+                thread.join(0.1)
+                self.assertTrue(thread.is_alive())
+            thread.join()
+            self.assertEqual(compact_manifest(manifest_path), {title: {'appended.txt'}})
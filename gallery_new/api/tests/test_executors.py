@@ -0,0 +1,55 @@
+from django.test import SimpleTestCase, override_settings
+
+from gallery_new.api.utils.executors import run_image_task, shutdown_executor
+from gallery_new.api.utils.exceptions import TooManyRequests
+from gallery_new.api.utils.thumbnails import render_image_thumbnails
+
+from PIL import Image
+from io import BytesIO
+from threading import Event, Thread
+import tempfile
+
+
+class TestExecutors(SimpleTestCase):
+
+    def tearDown(self):
+        shutdown_executor()
+
+    def render(self):
+        with tempfile.NamedTemporaryFile(suffix='.png') as image_file:
+            Image.new('RGB', (300, 300), (255, 0, 0)).save(image_file.name)
+            rendered = run_image_task(render_image_thumbnails, image_file.name, (256, 256), [32])
+        self.assertEqual(Image.open(BytesIO(rendered['thumb'])).size, (256, 256))
+        self.assertEqual(Image.open(BytesIO(rendered[32])).size, (32, 32))
+
+    def test_inline(self):
+        self.render()
+
+    @override_settings(IMAGE_EXECUTOR='thread')
+    def test_thread(self):
+        self.render()
+
+    @override_settings(IMAGE_EXECUTOR='process', IMAGE_WORKERS=2)
+    def test_process(self):
+        self.render()
+
+    @override_settings(IMAGE_EXECUTOR='thread', IMAGE_WORKERS=1, IMAGE_QUEUE_SIZE=0, IMAGE_QUEUE_TIMEOUT=0)
+    def test_queue_full(self):
+        started, release = Event(), Event()
+
+        def busy():
+            started.set()
+            release.wait(5)
+
+        thread = Thread(target=run_image_task, args=[busy])
+        thread.start()
+        started.wait(5)
+        try:
+            with self.assertRaises(TooManyRequests):
+                run_image_task(self.render)
+        finally:
+            release.set()
+            thread.join()
+
+        # slot is released after task
+        self.render()
@@ -0,0 +1,188 @@
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from django.db import OperationalError
+
+from gallery_new.api.models import MediaFile, EntityFile, Thumbnail, Job
+from gallery_new.api.utils.generators import hash_md5
+from gallery_new.api.utils import jobs
+from gallery_new.api.utils.jobs import enqueue, run_job, get_pending_jobs, run_worker, Heartbeat
+
+from datetime import timedelta
+from threading import Event
+from unittest import mock
+
+from PIL import Image
+from io import BytesIO
+import tempfile
+import time
+import av
+
+
+class TestJobs(TestCase):
+
+    def setUp(self):
+        self.user, created = User.objects.get_or_create(username='test@test')
+
+    def create_media_file(self, content, name='test.png', media_type='image/png'):
+        file = ContentFile(content, name)
+        entity_file = EntityFile.objects.create(file=file, hash=hash_md5(file))
+        return MediaFile.objects.create(
+            entity_file=entity_file,
+            media_type=media_type,
+            size=file.size,
+            name=file.name,
+            user=self.user
+        )
+
+    def create_image(self):
+        image_io = BytesIO()
+        Image.new("RGBA", (300, 300), (255, 0, 0, 0)).save(image_io, format='png')
+        return image_io.getvalue()
+
+    def test_run_job(self):
+        media_file = self.create_media_file(self.create_image())
+        job = enqueue('create_thumbnails', media_file_id=media_file.id)
+        self.assertEqual(job.state, Job.PENDING)
+        self.assertEqual(get_pending_jobs(10), [job])
+
+        self.assertTrue(run_job(job))
+
+        job.refresh_from_db()
+        self.assertEqual(job.state, Job.DONE)
+        self.assertTrue(Thumbnail.objects.filter(entity_file=media_file.entity_file).exists())
+
+        # done job is not executed again
+        self.assertFalse(run_job(job))
+
+    def test_unsupported_media_type(self):
+        # malformed media type is not a failure of job
+        for media_type in ['text/plain', 'image', 'image/png/x', '']:
+            media_file = self.create_media_file(media_type.encode() + b' text', 'test.txt', media_type)
+            job = enqueue('create_thumbnails', media_file_id=media_file.id)
+            self.assertTrue(run_job(job))
+            job.refresh_from_db()
+            self.assertEqual(job.state, Job.DONE)
+            self.assertFalse(Thumbnail.objects.filter(entity_file=media_file.entity_file).exists())
+
+    @override_settings(JOBS_MAX_ATTEMPTS=2)
+    def test_retry(self):
+        media_file = self.create_media_file(b'broken image')
+        job = enqueue('create_thumbnails', media_file_id=media_file.id)
+
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.state, Job.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertTrue(job.last_error)
+        self.assertGreater(job.run_at, timezone.now())
+
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.state, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    @override_settings(AVATAR_THUMBS_LAZY=False)
+    def test_avatar_thumbnails(self):
+        image_io = BytesIO()
+        Image.new('RGB', (300, 300), (255, 0, 0)).save(image_io, format='jpeg')
+        media_file = self.create_media_file(image_io.getvalue(), 'avatar.jpg', 'image/jpeg')
+
+        enqueue('create_thumbnails', media_file_id=media_file.id, is_avatar=True, avatar_thumbs=True)
+        run_job(Job.objects.get())
+
+        thumbnail = Thumbnail.objects.get(entity_file=media_file.entity_file, is_avatar=False)
+        self.assertEqual(Image.open(thumbnail.file.path).size, (256, 256))
+
+        # sizes less than image side, each has own file
+        avatar_thumbs = Thumbnail.objects.filter(entity_file=media_file.entity_file, is_avatar=True)
+        self.assertEqual(sorted(avatar_thumbs.values_list('side_size', flat=True)), [32, 48, 64, 96, 128, 192, 256])
+        for thumbnail in avatar_thumbs:
+            image = Image.open(thumbnail.file.path)
+            self.assertEqual(image.format, 'WEBP')
+            self.assertEqual(image.size, (thumbnail.side_size, thumbnail.side_size))
+
+    def create_video(self, width, height, frames=50):
+        with tempfile.NamedTemporaryFile(suffix='.mp4') as video_file:
+            with av.open(video_file.name, 'w') as container:
+                stream = container.add_stream('mpeg4', rate=25)
+                stream.width, stream.height, stream.pix_fmt = width, height, 'yuv420p'
+                for i in range(frames):
+                    frame = av.VideoFrame.from_image(Image.new('RGB', (width, height), (i * 5, 0, 0)))
+                    for packet in stream.encode(frame):
+                        container.mux(packet)
+                for packet in stream.encode():
+                    container.mux(packet)
+            return video_file.read()
+
+    def test_video_thumbnail(self):
+        media_file = self.create_media_file(self.create_video(320, 180), 'video.mp4', 'video/mp4')
+        enqueue('create_thumbnails', media_file_id=media_file.id)
+        run_job(Job.objects.get())
+
+        thumbnail = Thumbnail.objects.get(entity_file=media_file.entity_file)
+        image = Image.open(thumbnail.file.path)
+        self.assertEqual(image.format, 'JPEG')
+        self.assertEqual(image.size, (256, 256))
+        self.assertEqual(thumbnail.size, thumbnail.file.size)
+
+
+fast_jobs_done = Event()
+
+
+def slow_task(timeout):
+    # finished by fast jobs, which could be taken only while this one is running
+    if not fast_jobs_done.wait(timeout):
+        raise TimeoutError('Fast jobs were not run')
+
+
+def fast_task(last=False):
+    if last:
+        fast_jobs_done.set()
+
+
+@mock.patch.dict(jobs.TASKS, {
+    'slow': 'gallery_new.api.tests.test_jobs.slow_task',
+    'fast': 'gallery_new.api.tests.test_jobs.fast_task',
+})
+class TestJobsWorker(TransactionTestCase):
+
+    def setUp(self):
+        fast_jobs_done.clear()
+
+    def test_heartbeat(self):
+        job = Job.objects.create(task='fast', kwargs={}, state=Job.RUNNING)
+        updated_at = timezone.now() - timedelta(hours=1)
+        Job.objects.filter(id=job.id).update(updated_at=updated_at)
+
+        with Heartbeat(job.id, interval=0.05):
+            time.sleep(0.2)
+        job.refresh_from_db()
+        self.assertGreater(job.updated_at, updated_at)
+
+    def test_run_worker(self):
+        enqueue('slow', timeout=5)
+        for i in range(4):
+            enqueue('fast', last=i == 3)
+
+        # jobs are taken while slow job of the same batch is running
+        self.assertEqual(run_worker(workers=2, poll_interval=0.05, once=True), 5)
+        self.assertEqual(Job.objects.filter(state=Job.DONE).count(), 5)
+
+    def test_run_worker_error(self):
+        failed = enqueue('fast')
+        enqueue('fast')
+        real_run_job = jobs.run_job
+
+        def run_job_with_error(job):
+            if job.id != failed.id:
+                return real_run_job(job)
+            Job.objects.filter(id=job.id).update(state=Job.RUNNING)
+            raise OperationalError('database is locked')
+
+        # error of one job doesn't stop worker
+        with mock.patch.object(jobs, 'run_job', run_job_with_error):
+            with self.assertLogs(jobs.logger, 'ERROR'):
+                self.assertEqual(run_worker(workers=2, poll_interval=0.05, once=True), 1)
+        self.assertEqual(Job.objects.filter(state=Job.DONE).count(), 1)
@@ -1,18 +1,39 @@
 from django.urls import reverse
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, update_last_login
 from django.core.files.base import ContentFile
+from django.core.files.uploadhandler import StopUpload
+from django.core.cache import cache
+from django.core.management import call_command
 from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.conf import settings
 from django.urls import path, include
+from django.utils import timezone
 
-from rest_framework.test import APIClient, APITestCase, URLPatternsTestCase
+from rest_framework.test import APIClient, APITestCase, URLPatternsTestCase, APIRequestFactory
 from rest_framework import status
 
-from gallery_new.api.models import Token, MediaFile, EntityFile, VerificationCode
+from gallery_new.api.models import Token, MediaFile, EntityFile, VerificationCode, Quota, Thumbnail, Job, MediaFileChange,\
+    Counter, UploadSession
+from gallery_new.api import cache_tokens
 from gallery_new.api.utils.generators import hash_md5
+from gallery_new.api.utils.thumbnails import create_thumbnails, AVATAR_THUMBS_USED
+from gallery_new.api.utils.jobs import run_job
+from gallery_new.api.utils.simlinks import get_symlink_dir
+from gallery_new.api.utils.downloads import serve_file
+from gallery_new.api.utils.uploads import purge_expired_sessions
+from gallery_new.api.utils.asynchronous import async_view
+from gallery_new.api.views import FilesView, AvatarView, QuotaView, StatsView
+from gallery_new.api.limit_size_fileupload_handler import LimitSizeFileUploadHandler
 
 from PIL import Image
-from io import BytesIO
+from io import BytesIO, StringIO
+from pathlib import Path
+from datetime import timedelta
+from asgiref.sync import async_to_sync
+from urllib.parse import unquote
+import os
+import json
 
 
 class TestViews(APITestCase, URLPatternsTestCase):
@@ -22,6 +43,9 @@ class TestViews(APITestCase, URLPatternsTestCase):
     ]
 
     def setUp(self):
+        # reset upload rate limits
+        cache.clear()
+
         self.client = APIClient()
         self.user, created = User.objects.get_or_create(username='test@test')
         self.token, created = Token.objects.get_or_create(user=self.user)
@@ -78,9 +102,93 @@ class TestViews(APITestCase, URLPatternsTestCase):
         response = self.client.get(url)
         self.assertEquals(response.status_code, status.HTTP_200_OK)
 
+        # media type substring match
+        for media_type, count in [('png', 1), ('image', 1), ('image/pn', 1), ('video', 0)]:
+            response = self.client.get(url, {'media_type': media_type})
+            self.assertEquals(response.data['total_objects'], count)
+
+        # media type prefix and exact match
+        for media_type, count in [('image', 1), ('image/png', 1), ('image/pn', 0), ('png', 0), ('video', 0)]:
+            response = self.client.get(url, {'media_type_prefix': media_type})
+            self.assertEquals(response.data['total_objects'], count)
+
+    def test_files_GET_query_plan(self):
+
+        """ FilesView queries are selected by indexes of not avatar files on SQLite """
+
+        url = reverse('files')
+        MediaFile.objects.bulk_create([
+            MediaFile(
+                entity_file=self.entity_file,
+                media_type=['image/png', 'image/jpeg', 'video/mp4', 'text/plain'][i % 4],
+                size=i,
+                name='plan%s' % i,
+                title='plan%s' % i,
+                user=self.user,
+                is_avatar=i % 10 == 0
+            ) for i in range(1000)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        for params in [{}, {'media_type_prefix': 'image'}, {'media_type_prefix': 'image/png'}, {'cursor': ''}, {'size_gte': 500}]:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, params)
+            self.assertEquals(response.status_code, status.HTTP_200_OK)
+            for query in queries:
+                if 'FROM "api_mediafile"' in query['sql'] and 'ORDER BY' in query['sql']:
+                    with connection.cursor() as cursor:
+                        cursor.execute('EXPLAIN QUERY PLAN ' + query['sql'])
+                        plan = ' '.join(str(row[-1]) for row in cursor.fetchall())
+                    # rows are read in order of partial index, not sorted
+                    self.assertIn('USING INDEX api_mediafile_', plan)
+                    self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_files_GET_cursor(self):
+        url = reverse('files')
+
+        for i in range(2):
+            MediaFile.objects.create(
+                entity_file=self.entity_file,
+                media_type='image/png',
+                name='cursor%s.png' % i,
+                user=self.user
+            )
+
+        # first page with total count
+        response = self.client.get(url, {'cursor': '', 'obj_per_page': 2, 'count': 1})
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.data['total_objects'], 3)
+        ids = [item['id'] for item in response.data['items']]
+
+        response = self.client.get(url, {'cursor': response.data['next_cursor'], 'obj_per_page': 2})
+        self.assertNotIn('total_objects', response.data)
+        self.assertIsNone(response.data['next_cursor'])
+        ids += [item['id'] for item in response.data['items']]
+
+        self.assertEquals(ids, list(
+            MediaFile.objects.filter(is_avatar=False).order_by('-created_at', '-id').values_list('id', flat=True)
+        ))
+
+        response = self.client.get(url, {'cursor': 'wrong'})
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_files_DELETE(self):
         url = reverse('files')
 
+        # files of other users are not deleted
+        other_user = User.objects.create(username='other@test')
+        other_file = MediaFile.objects.create(
+            entity_file=self.entity_file, media_type='image/png', name='other.png', user=other_user
+        )
+        response = self.client.delete(url, data={'id': other_file.id})
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.client.delete(url, data={'media_type': 'image'})
+        self.assertTrue(MediaFile.objects.filter(id=other_file.id).exists())
+        self.media_file = MediaFile.objects.create(
+            entity_file=self.entity_file, media_type='image/png', name='test.png', user=self.user
+        )
+
         response = self.client.delete(url, data={'id': self.media_file.id})
         self.assertEquals(response.status_code, status.HTTP_204_NO_CONTENT)
 
@@ -90,6 +198,33 @@ class TestViews(APITestCase, URLPatternsTestCase):
         response = self.client.delete(url, data={})
         self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_files_DELETE_bulk(self):
+        url = reverse('files')
+
+        file = ContentFile(b'video', 'video.mp4')
+        entity_file = EntityFile.objects.create(file=file, hash=hash_md5(file))
+        for i in range(3):
+            MediaFile.objects.create(entity_file=entity_file, media_type='video/mp4', name=file.name, user=self.user)
+        titles = list(MediaFile.objects.filter(media_type='video/mp4').values_list('title', flat=True))
+
+        # rows are deleted by one query without collecting them for signals
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.delete(url, data={'media_type': 'video'})
+        self.assertEquals(response.status_code, status.HTTP_204_NO_CONTENT)
+        queries = [query['sql'] for query in context.captured_queries]
+        self.assertEquals(len([sql for sql in queries if sql.startswith('DELETE FROM "api_mediafile"')]), 1)
+        self.assertEquals(len([sql for sql in queries if sql.startswith('INSERT INTO "api_mediafilechange"')]), 1)
+
+        self.assertFalse(MediaFile.objects.filter(media_type='video/mp4').exists())
+        # unused original file is marked for garbage collector
+        entity_file.refresh_from_db()
+        self.assertEquals(entity_file.ref_count, 0)
+        self.assertIsNotNone(entity_file.orphaned_at)
+        self.assertIsNone(EntityFile.objects.get(id=self.entity_file.id).orphaned_at)
+        self.assertEquals(Quota.objects.get(user=self.user).used, self.media_file.size * 2)
+        for title in titles:
+            self.assertFalse(get_symlink_dir(title).exists())
+
     def test_files_upload_POST(self):
         url = reverse('files_upload')
 
@@ -102,6 +237,15 @@ class TestViews(APITestCase, URLPatternsTestCase):
         response = self.client.post(url, data, format='multipart')
         self.assertEquals(response.status_code, status.HTTP_201_CREATED)
 
+        # file name is quoted in urls
+        file.seek(0)
+        file.name = 'test 1.png'
+        response = self.client.post(url, data, format='multipart')
+        self.assertEquals(
+            response.data['file'], '{}{}/test%201.png'.format(settings.STATIC_LINK, response.data['slot_id'])
+        )
+        self.assertTrue(response.data['thumbnail']['url'].endswith('/thumb_test%201.png'))
+
         # upload with oversize
         response = self.client.post(url, {'file': file, 'size': self.oversize}, format='multipart')
         self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -114,6 +258,242 @@ class TestViews(APITestCase, URLPatternsTestCase):
         response = self.client.post(url)
         self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_files_upload_hash(self):
+        url = reverse('files_upload')
+
+        image_io = BytesIO()
+        Image.new("RGB", (300, 200), (0, 255, 0)).save(image_io, format='png')
+        file = ContentFile(image_io.getvalue(), 'hash.png')
+
+        response = self.client.post(url, {'media_type': 'image/png', 'file': file}, format='multipart')
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(response.data['hash'], hash_md5(BytesIO(image_io.getvalue())))
+
+        # avatar is accepted without cropping, max size is read from image header
+        file.seek(0)
+        response = self.client.post(reverse('avatar_upload'), {'media_type': 'image/png', 'file': file}, format='multipart')
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(response.data['hash'], hash_md5(BytesIO(image_io.getvalue())))
+        self.assertEquals(len(response.data['thumbnails']), 6)
+
+        # cropped avatar replaces original file, hash should match stored file
+        run_job(Job.objects.get(task='normalize_avatar'))
+        avatar = MediaFile.objects.select_related('entity_file').get(id=response.data['id'])
+        self.assertEquals(Image.open(avatar.entity_file.file.path).size, (200, 200))
+        self.assertEquals(avatar.entity_file.hash, hash_md5(avatar.entity_file.file.open('rb')))
+        self.assertEquals(avatar.size, avatar.entity_file.file.size)
+        self.assertEquals(avatar.entity_file.ref_count, 1)
+
+        # original file is still used by uploaded file
+        self.assertEquals(EntityFile.objects.get(hash=response.data['hash']).ref_count, 1)
+        quota = Quota.objects.get(user=self.user)
+        self.assertEquals(quota.used, quota.get_quota_used())
+
+    def test_files_upload_declared_hash(self):
+        url = reverse('files_upload')
+
+        # original file exists, file body is skipped
+        data = {
+            'media_type': 'image/png',
+            'file': self.create_file()
+        }
+        response = self.client.post(url, data, format='multipart', HTTP_X_FILE_HASH=self.hash)
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(response.data['hash'], self.hash)
+        self.assertEquals(EntityFile.objects.count(), 1)
+
+        # rest of body is drained instead of reset connection, entity file is passed on request
+        request = APIRequestFactory().post(url, HTTP_X_FILE_HASH=self.hash)
+        request.user = self.user
+        with self.assertRaises(StopUpload) as context:
+            LimitSizeFileUploadHandler(request).new_file('file', 'test.png', 'image/png', 100)
+        self.assertFalse(context.exception.connection_reset)
+        self.assertEquals(request.existing_entity_file, self.entity_file)
+        self.assertNotIn('existing_entity_file', request.META)
+
+        # declared hash doesn't match uploaded file
+        data['file'] = self.create_file()
+        response = self.client.post(url + '?hash=123', data, format='multipart')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_session(self):
+        content = self.create_file().read()
+        middle = len(content) // 2
+
+        response = self.client.post(reverse('upload_sessions'), {
+            'name': 'resumable.png',
+            'media_type': 'image/png',
+            'size': len(content)
+        })
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        url = reverse('upload_session', kwargs={'session_id': response.data['session_id']})
+
+        response = self.client.put(
+            url, content[:middle], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE='bytes 0-%s/%s' % (middle - 1, len(content))
+        )
+        self.assertEquals(response.data['offset'], middle)
+
+        # chunk with wrong offset
+        response = self.client.put(url, content[:middle], content_type='application/octet-stream',
+                                   HTTP_CONTENT_RANGE='bytes 0-%s/%s' % (middle - 1, len(content)))
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # file is not uploaded completely
+        finish_url = reverse('upload_session_finish', kwargs={'session_id': url.split('/')[-2]})
+        response = self.client.post(finish_url)
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.put(url, content[middle:], content_type='application/octet-stream')
+        self.assertEquals(response.data['offset'], len(content))
+
+        response = self.client.post(finish_url)
+        self.assertEquals(response.status_code, status.HTTP_201_CREATED)
+        self.assertEquals(response.data['hash'], self.hash)
+        created = response.data
+
+        # retried finish returns created file
+        response = self.client.post(finish_url)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.data['hash'], created['hash'])
+        self.assertEquals(MediaFile.objects.filter(name='resumable.png').count(), 1)
+
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_upload_session_expired(self):
+        response = self.client.post(reverse('upload_sessions'), {
+            'name': 'resumable.png',
+            'media_type': 'image/png',
+            'size': 100
+        })
+        session = UploadSession.objects.get(session_id=response.data['session_id'])
+        self.assertTrue(os.path.exists(session.get_staging_path()))
+
+        self.assertEquals(purge_expired_sessions(), 0)
+        expired = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_LIFETIME + 1)
+        UploadSession.objects.filter(id=session.id).update(updated_at=expired)
+        self.assertEquals(purge_expired_sessions(), 1)
+        self.assertFalse(os.path.exists(session.get_staging_path()))
+
+    @override_settings(CHANGES_SETTLE=0)
+    def test_files_changes_GET(self):
+        url = reverse('files_changes')
+
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        cursor = response.data['next_cursor']
+
+        created = MediaFile.objects.create(entity_file=self.entity_file, name='new.png', user=self.user)
+        deleted_id = self.media_file.id
+        self.media_file.delete()
+        MediaFile.objects.create(entity_file=self.entity_file, name='avatar.png', user=self.user, is_avatar=True)
+
+        response = self.client.get(url, {'since': cursor})
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals([media_file['id'] for media_file in response.data['created']], [created.id])
+        self.assertEquals(response.data['deleted'], [deleted_id])
+        self.assertFalse(response.data['has_more'])
+        cursor = response.data['next_cursor']
+
+        # bulk deletion records changes too
+        self.client.delete(reverse('files'), data={'media_type': 'image'})
+        with override_settings(CHANGES_PAGE_SIZE=1):
+            response = self.client.get(url, {'since': cursor})
+        self.assertEquals(response.data['deleted'], [created.id])
+        self.assertEquals(response.data['created'], [])
+
+        response = self.client.get(url, {'since': response.data['next_cursor']})
+        self.assertEquals(response.data['deleted'], [])
+        self.assertEquals(response.data['next_cursor'], str(MediaFileChange.get_cursor()))
+
+        # changes after cursor were pruned
+        call_command('prune_changes', '--keep', '-1', stdout=StringIO())
+        self.assertEquals(MediaFileChange.objects.count(), 1)
+        response = self.client.get(url, {'since': cursor})
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(response.json()['error'], 'Cursor expired')
+
+    def test_files_changes_settle(self):
+        url = reverse('files_changes')
+        MediaFileChange.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        cursor = self.client.get(url).data['next_cursor']
+
+        # change of long transaction gets smaller id but is committed after the next one
+        first = MediaFile.objects.create(entity_file=self.entity_file, name='first.png', user=self.user)
+        second = MediaFile.objects.create(entity_file=self.entity_file, name='second.png', user=self.user)
+        MediaFileChange.objects.filter(media_file_id=second.id).update(created_at=timezone.now() - timedelta(hours=1))
+
+        # the second change is held back until the first one is settled
+        response = self.client.get(url, {'since': cursor})
+        self.assertEquals(response.data['created'], [])
+        self.assertEquals(response.data['next_cursor'], cursor)
+
+        MediaFileChange.objects.filter(media_file_id=first.id).update(created_at=timezone.now() - timedelta(hours=1))
+        response = self.client.get(url, {'since': cursor})
+        self.assertEquals([media_file['id'] for media_file in response.data['created']], [first.id, second.id])
+
+    def serve_accel_redirect(self, response, **headers):
+
+        """ Stand-in of nginx: internal location SENDFILE_URL_PREFIX is an alias of MEDIA_ROOT """
+
+        location = response['X-Accel-Redirect']
+        self.assertTrue(location.startswith(settings.SENDFILE_URL_PREFIX))
+        path = os.path.join(settings.MEDIA_ROOT, unquote(location[len(settings.SENDFILE_URL_PREFIX):]))
+        return serve_file(APIRequestFactory().get(location, **headers), path, response['Content-Type'])
+
+    def test_files_download_GET(self):
+        url = reverse('files_download', args=[self.media_file.title, self.media_file.name])
+        content = self.entity_file.file.open('rb').read()
+        self.entity_file.file.close()
+
+        response = self.client.get(url, HTTP_ACCEPT='image/*')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(b''.join(response.streaming_content), content)
+        self.assertEquals(response['ETag'], '"{}"'.format(self.hash))
+        self.assertEquals(response['Accept-Ranges'], 'bytes')
+
+        response = self.client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEquals(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEquals(b''.join(response.streaming_content), content[10:20])
+        self.assertEquals(response['Content-Range'], 'bytes 10-19/{}'.format(len(content)))
+
+        # range of changed file is ignored
+        response = self.client.get(url, HTTP_RANGE='bytes=-5', HTTP_IF_RANGE='"changed"')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get(url, HTTP_RANGE='bytes={}-'.format(len(content)))
+        self.assertEquals(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"{}"'.format(self.hash))
+        self.assertEquals(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # files of other users are not available
+        self.media_file.user = User.objects.create(username='other@test')
+        self.media_file.save()
+        response = self.client.get(url, HTTP_ACCEPT='image/*')
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(SENDFILE_BACKEND='nginx')
+    def test_files_download_accel_redirect(self):
+        url = reverse('files_download', args=[self.media_file.title, self.media_file.name])
+        content = self.entity_file.file.open('rb').read()
+        self.entity_file.file.close()
+
+        response = self.client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.content, b'')
+        self.assertEquals(response['ETag'], '"{}"'.format(self.hash))
+
+        # front server serves range of file
+        served = self.serve_accel_redirect(response, HTTP_RANGE='bytes=-5')
+        self.assertEquals(served.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEquals(b''.join(served.streaming_content), content[-5:])
+
+        with override_settings(SENDFILE_BACKEND='apache'):
+            response = self.client.get(url)
+        self.assertEquals(response['X-Sendfile'], self.entity_file.file.path)
+
     def test_slot_GET(self):
         url = reverse('slot')
 
@@ -132,6 +512,44 @@ class TestViews(APITestCase, URLPatternsTestCase):
         response = self.client.get(url, data)
         self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_slot_batch_POST(self):
+        url = reverse('slot_batch')
+
+        file = ContentFile(b'video', 'video.mp4')
+        video = EntityFile.objects.create(file=file, hash=hash_md5(file))
+        refs = EntityFile.objects.get(id=self.entity_file.id).ref_count
+        used = Quota.objects.get(user=self.user).used
+        cursor = MediaFileChange.get_cursor()
+
+        files = [
+            {'hash': self.hash, 'size': self.media_file.size, 'name': 'first.png'},
+            {'hash': self.hash, 'size': self.media_file.size, 'name': 'second.png'},
+            {'hash': video.hash, 'size': 5, 'name': 'video.mp4'},
+            {'hash': 'missing', 'size': 10, 'name': 'missing.png'},
+        ]
+        response = self.client.post(url, data={'files': files}, format='json')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals([file['name'] for file in response.data['created']], ['first.png', 'second.png', 'video.mp4'])
+        self.assertEquals(response.data['missing'], ['missing'])
+        self.assertEquals(response.data['used'], used + self.media_file.size * 2 + 5)
+        self.assertEquals(Quota.objects.get(user=self.user).used, response.data['used'])
+
+        self.assertEquals(EntityFile.objects.get(id=self.entity_file.id).ref_count, refs + 2)
+        video.refresh_from_db()
+        self.assertEquals(video.ref_count, 1)
+        self.assertIsNone(video.orphaned_at)
+
+        media_file = MediaFile.objects.get(name='video.mp4')
+        self.assertEquals(media_file.media_type, 'video/mp4')
+        self.assertTrue(Path(get_symlink_dir(media_file.title), 'video.mp4').is_symlink())
+        self.assertEquals(MediaFileChange.objects.filter(id__gt=cursor, action=MediaFileChange.CREATED).count(), 3)
+
+        # quota is checked for all files together
+        files = [{'hash': self.hash, 'size': self.oversize // 2 + 1, 'name': 'big.png'}] * 2
+        response = self.client.post(url, data={'files': files}, format='json')
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(MediaFile.objects.filter(name='big.png').exists())
+
     def test_xmpp_code_request_POST(self):
         url = reverse('xmpp_code_request')
 
@@ -171,6 +589,42 @@ class TestViews(APITestCase, URLPatternsTestCase):
         response = self.client.delete(url, {'token_id': self.token.id})
         self.assertEquals(response.status_code, status.HTTP_204_NO_CONTENT)
 
+        # deleted token is removed from cache
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(TOKENS_CACHE_TIMEOUT=300)
+    def test_tokens_cache(self):
+        url = reverse('quota')
+        self.user.set_password('password')
+        self.user.save()
+
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+
+        # only id, username and is_active of user are cached, LocMem cache is not used by other processes
+        expiry, (token_values, user_values) = cache_tokens._tokens[self.token.key]
+        self.assertEquals(user_values, [self.user.id, self.user.username, True])
+        self.assertIsNone(cache.get('t_{}'.format(self.token.key)))
+
+        # cached token is resolved without database
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertFalse([query for query in context.captured_queries if 'api_token' in query['sql']])
+
+        # login doesn't invalidate cached token
+        with CaptureQueriesContext(connection) as context:
+            update_last_login(None, self.user)
+        self.assertFalse([query for query in context.captured_queries if 'api_token' in query['sql']])
+
+        # changes of token invalidate cache
+        self.token.expires = timezone.now() - timedelta(seconds=1)
+        self.token.save()
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertFalse(Token.objects.filter(id=self.token.id).exists())
+
     def test_account_DELETE(self):
         url = reverse('account')
 
@@ -190,6 +644,12 @@ class TestViews(APITestCase, URLPatternsTestCase):
 
         response = self.client.get(url, {})
         self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.data['used'], self.media_file.size * 2)
+
+        # quota is updated on deleting
+        self.avatar.delete()
+        response = self.client.get(url, {})
+        self.assertEquals(response.data['used'], self.media_file.size)
 
 
     def test_quota_PUT(self):
@@ -240,6 +700,92 @@ class TestViews(APITestCase, URLPatternsTestCase):
         response = self.client.get(url)
         self.assertEquals(response.status_code, status.HTTP_200_OK)
 
+    def test_avatar_GET_queries(self):
+        url = reverse('avatar')
+
+        for i in range(5):
+            file = self.create_file()
+            entity_file = EntityFile.objects.create(file=file, hash='avatar%s' % i)
+            entity_file.thumbnail_set.create(is_avatar=True, side_size=32, file='32_avatar.webp')
+            MediaFile.objects.create(
+                entity_file=entity_file,
+                media_type='image/png',
+                name=file.name,
+                user=self.user,
+                is_avatar=True,
+                avatar_thumbs=True
+            )
+
+        # number of queries doesn't depend on page size
+        self.client.get(url)
+        queries = []
+        for page_size in [1, 6]:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url, {'obj_per_page': page_size})
+            self.assertEquals(len(response.data['items']), page_size)
+            queries.append(len(context))
+        self.assertEquals(queries[0], queries[1])
+
+    def test_avatar_thumbnail_GET(self):
+        self.avatar.avatar_thumbs = True
+        self.avatar.save()
+
+        # lazy sizes are not rendered by job
+        create_thumbnails(self.avatar, is_avatar=True, avatar_thumbs=True)
+        thumbnails = Thumbnail.objects.filter(entity_file=self.entity_file, is_avatar=True)
+        self.assertEquals(sorted(thumbnails.values_list('side_size', flat=True)), [32, 48, 64, 96, 128, 192])
+        self.assertFalse(thumbnails.exclude(file='').exists())
+
+        # thumbnails are public as static files
+        client = APIClient()
+        response = client.get(reverse('avatar_thumbnail', args=[self.avatar.title, 64]))
+        self.assertEquals(response.status_code, status.HTTP_302_FOUND)
+        self.assertTrue(response['Location'].endswith('/%s/64_test.webp' % self.avatar.title))
+
+        thumbnail = thumbnails.get(side_size=64)
+        self.assertEquals(Image.open(thumbnail.file.path).size, (64, 64))
+        self.assertEquals(thumbnail.size, thumbnail.file.size)
+        self.assertIsNotNone(thumbnail.accessed_at)
+
+        response = client.get(reverse('avatar_thumbnail', args=[self.avatar.title, 768]))
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = client.get(reverse('avatar_thumbnail', args=[self.avatar.title, 65]))
+        self.assertEquals(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        # stored size is counted without aggregating thumbnails
+        self.assertEquals(Counter.get_value(AVATAR_THUMBS_USED), thumbnail.size)
+
+        # least recently requested size is evicted over budget with symlinks
+        with self.settings(AVATAR_THUMBS_CACHE_SIZE=thumbnail.size):
+            response = client.get(reverse('avatar_thumbnail', args=[self.avatar.title, 32]))
+        self.assertEquals(response.status_code, status.HTTP_302_FOUND)
+        self.assertFalse(thumbnails.get(side_size=64).file)
+        self.assertFalse(os.path.lexists(Path(get_symlink_dir(self.avatar.title), '64_test.webp')))
+        self.assertTrue(thumbnails.get(side_size=32).file)
+        self.assertEquals(Counter.get_value(AVATAR_THUMBS_USED), thumbnails.get(side_size=32).size)
+
+        # requested thumbnail is kept even if it doesn't fit budget
+        with self.settings(AVATAR_THUMBS_CACHE_SIZE=0):
+            response = client.get(reverse('avatar_thumbnail', args=[self.avatar.title, 48]))
+        self.assertEquals(response.status_code, status.HTTP_302_FOUND)
+        self.assertTrue(Path(get_symlink_dir(self.avatar.title), '48_test.webp').exists())
+        self.assertFalse(thumbnails.get(side_size=32).file)
+
+        # renders are limited for client, stored sizes are not
+        with self.settings(AVATAR_THUMBS_RENDER_LIMIT=0):
+            response = client.get(reverse('avatar_thumbnail', args=[self.avatar.title, 96]))
+            self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+            self.assertEquals(response.json()['error'], 'Too many requests')
+            response = client.get(reverse('avatar_thumbnail', args=[self.avatar.title, 48]))
+            self.assertEquals(response.status_code, status.HTTP_302_FOUND)
+
+        # avatar list links to lazy thumbnails
+        response = self.client.get(reverse('avatar'))
+        self.assertIn(
+            reverse('avatar_thumbnail', args=[self.avatar.title, 32]),
+            response.data['items'][0]['thumbnails'][0]['url']
+        )
+
     def test_avatar_DELETE(self):
         url = reverse('avatar')
 
@@ -256,4 +802,70 @@ class TestViews(APITestCase, URLPatternsTestCase):
         url = reverse('stats')
 
         response = self.client.get(url)
-        self.assertEquals(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.data['images']['count'], 2)
+        self.assertEquals(response.data['total']['used'], self.media_file.size * 2)
+
+        # cached stats are computed once, token is cached too, only quota is requested
+        with self.assertNumQueries(1):
+            self.client.get(url)
+
+        # cached stats are deleted on deleting of file
+        self.media_file.delete()
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEquals(response.data['images'], {'count': 1, 'used': self.avatar.size})
+        self.assertEquals(response.data['videos'], {'count': 0, 'used': 0})
+
+        # LocMem cache is not invalidated in other processes, stats are cached for short time
+        cache.clear()
+        with self.settings(STATS_LOCAL_CACHE_TIMEOUT=0):
+            self.client.get(url)
+            with self.assertNumQueries(2):
+                self.client.get(url)
+
+    def test_conditional_GET(self):
+        for name in ['files', 'avatar', 'quota', 'stats']:
+            url = reverse(name)
+            response = self.client.get(url)
+            self.assertEquals(response.status_code, status.HTTP_200_OK)
+            etag = response['ETag']
+
+            # only version of gallery is requested
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEquals(response.status_code, status.HTTP_304_NOT_MODIFIED)
+            self.assertEquals(response['ETag'], etag)
+
+            # changes in the same second are not seen by If-Modified-Since
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEquals(response.status_code, status.HTTP_200_OK)
+
+        etag = self.client.get(reverse('files'))['ETag']
+        MediaFile.objects.create(entity_file=self.entity_file, name='new.png', user=self.user)
+        response = self.client.get(reverse('files'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertNotEquals(response['ETag'], etag)
+
+        # bulk deletion changes version too
+        etag = response['ETag']
+        self.client.delete(reverse('files'), data={'media_type': 'image'})
+        response = self.client.get(reverse('stats'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(ASYNC_VIEWS_THREAD_SENSITIVE=True)
+    def test_async_views(self):
+        factory = APIRequestFactory()
+        views = [
+            (FilesView.as_view({'get': 'list'}), reverse('files')),
+            (AvatarView.as_view({'get': 'list'}), reverse('avatar')),
+            (QuotaView.as_view(), reverse('quota')),
+            (StatsView.as_view(), reverse('stats')),
+        ]
+
+        # async variants return the same responses
+        for view, url in views:
+            request = factory.get(url, HTTP_AUTHORIZATION='Bearer ' + str(self.token.key))
+            response = async_to_sync(async_view(view))(request)
+            self.assertEquals(response.status_code, status.HTTP_200_OK)
+            self.assertEquals(json.loads(response.content), self.client.get(url).json())
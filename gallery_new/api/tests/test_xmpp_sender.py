@@ -0,0 +1,122 @@
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from gallery_new.api.utils import xmpp_sender
+from gallery_new.api.utils.xmpp_sender import XmppSender, get_metrics
+
+
+class FakeClient:
+
+    """ Stand-in XMPP client, connection is broken after sending limit """
+
+    def __init__(self, server, domain):
+        self.server = server
+        self.domain = domain
+        self.connected = None
+        self.sent = 0
+
+    def connect(self):
+        self.server['connects'] += 1
+        self.connected = 'tcp'
+        return self.connected
+
+    def auth(self, node, password, resource=None):
+        return password == 'password'
+
+    def isConnected(self):
+        return self.connected
+
+    def send(self, data):
+        if self.sent >= self.server['break_after']:
+            self.connected = None
+            raise IOError('Connection closed')
+        self.sent += 1
+        self.server['data'].append(data)
+
+    def Process(self, timeout=0):
+        # xmpppy returns '0' if nothing was read and 0 if connection is closed
+        self.server['processed'] += 1
+        return '0' if self.connected else 0
+
+    def disconnect(self):
+        self.connected = None
+
+
+class TestXmppSender(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.server = {'connects': 0, 'data': [], 'break_after': 100, 'processed': 0}
+
+    def create_sender(self, password='password', **kwargs):
+        return XmppSender(
+            'api@test.test/gallery', password,
+            client_factory=lambda domain: FakeClient(self.server, domain),
+            reconnect_delay=0,
+            **kwargs
+        )
+
+    def send_codes(self, sender, count):
+        for i in range(count):
+            self.assertTrue(sender.send_code(str(i), 'user{}@test.test'.format(i), 'id{}'.format(i), 'message', 'url'))
+        sender.stop()
+
+    def test_send(self):
+        sender = self.create_sender()
+        self.send_codes(sender, 5)
+
+        # all codes are sent through one connection
+        self.assertEqual(self.server['connects'], 1)
+        data = ''.join(self.server['data'])
+        for i in range(5):
+            self.assertIn('to="user{}@test.test"'.format(i), data)
+            self.assertIn('Verification code is {}'.format(i), data)
+
+        metrics = get_metrics()
+        self.assertEqual(metrics['queued'], 5)
+        self.assertEqual(metrics['sent'], 5)
+        self.assertEqual(metrics['failed'], 0)
+        self.assertEqual(metrics['batches'], len(self.server['data']))
+
+    def test_reconnect(self):
+        self.server['break_after'] = 1
+        sender = self.create_sender(batch_size=1)
+        with self.assertLogs(xmpp_sender.logger, 'ERROR'):
+            self.send_codes(sender, 3)
+
+        # connection is restored after every broken send
+        self.assertEqual(self.server['connects'], 3)
+        self.assertEqual(len(self.server['data']), 3)
+        self.assertEqual(get_metrics()['sent'], 3)
+        self.assertEqual(get_metrics()['reconnects'], 2)
+
+    def test_auth_error(self):
+        sender = self.create_sender(password='wrong')
+        # errors of background thread are logged
+        with self.assertLogs(xmpp_sender.logger, 'ERROR'):
+            self.send_codes(sender, 2)
+        self.assertEqual(self.server['data'], [])
+        self.assertEqual(get_metrics()['failed'], 2)
+
+    def test_queue_full(self):
+        sender = self.create_sender(queue_size=1)
+        # codes are not consumed without started thread
+        sender.start = lambda: None
+        self.assertTrue(sender.send_code('1', 'user@test.test', 'id', 'message', 'url'))
+        self.assertFalse(sender.send_code('2', 'user@test.test', 'id', 'message', 'url'))
+        self.assertEqual(get_metrics()['dropped'], 1)
+
+    def test_ping(self):
+        sender = self.create_sender()
+        sender._connect()
+
+        # incoming stanzas are read before whitespace ping
+        sender._ping()
+        self.assertEqual(self.server['processed'], 1)
+        self.assertEqual(self.server['data'], [' '])
+
+        # closed connection is dropped
+        sender._client.connected = None
+        sender._ping()
+        self.assertIsNone(sender._client)
+        self.assertEqual(self.server['data'], [' '])
@@ -1,19 +1,38 @@
 from django.urls import path
+from django.conf import settings
 from .views import FilesView, UploadFileView, SlotView, XmppAuthView, TokensView,\
-    QuotaView, AccountListView, AccountView, XmppCodeView, AvatarView, StatsView
+    QuotaView, AccountListView, AccountView, XmppCodeView, AvatarView, StatsView, UploadSessionView,\
+    UploadSessionDetailView, UploadSessionFinishView, AvatarThumbnailView, FileDownloadView, FileChangesView,\
+    SlotBatchView
+from .utils.asynchronous import async_view
+
+
+def read_view(view):
+
+    """ Read endpoints run in thread pool under ASGI server """
+
+    return async_view(view) if settings.ASYNC_VIEWS else view
 
 
 urlpatterns = [
-    path('files/', FilesView.as_view({'get': 'list', 'delete': 'delete'}), name='files'),
+    path('files/', read_view(FilesView.as_view({'get': 'list', 'delete': 'delete'})), name='files'),
     path('files/upload/', UploadFileView.as_view(), name='files_upload'),
+    path('files/upload/sessions/', UploadSessionView.as_view(), name='upload_sessions'),
+    path('files/upload/sessions/<str:session_id>/', UploadSessionDetailView.as_view(), name='upload_session'),
+    path('files/upload/sessions/<str:session_id>/finish/', UploadSessionFinishView.as_view(),
+         name='upload_session_finish'),
+    path('files/changes/', read_view(FileChangesView.as_view()), name='files_changes'),
+    path('files/download/<str:slot_id>/<str:name>/', FileDownloadView.as_view(), name='files_download'),
     path('files/slot/', SlotView.as_view(), name='slot'),
-    path(r'files/stats/', StatsView.as_view(), name='stats'),
-    path('avatar/', AvatarView.as_view({'get': 'list', 'delete': 'delete'}), name='avatar'),
+    path('files/slot/batch/', SlotBatchView.as_view(), name='slot_batch'),
+    path(r'files/stats/', read_view(StatsView.as_view()), name='stats'),
+    path('avatar/', read_view(AvatarView.as_view({'get': 'list', 'delete': 'delete'})), name='avatar'),
     path('avatar/upload/', UploadFileView.as_view(), {'is_avatar': True}, name='avatar_upload'),
+    path('avatar/thumbnails/<str:slot_id>/<int:side_size>/', AvatarThumbnailView.as_view(), name='avatar_thumbnail'),
     path('account/xmpp_code_request/', XmppCodeView.as_view(), name='xmpp_code_request'),
     path('account/xmpp_auth/', XmppAuthView.as_view(), name='xmpp_auth'),
     path('account/tokens/', TokensView.as_view({'get': 'list', 'delete': 'delete'}), name='tokens'),
-    path('account/quota/', QuotaView.as_view(), name='quota'),
+    path('account/quota/', read_view(QuotaView.as_view()), name='quota'),
     path('account/', AccountView.as_view({'delete': 'delete'}), name='account'),
     path('account/list/', AccountListView.as_view(), name='account_list'),
 ]
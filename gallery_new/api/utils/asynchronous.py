@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.db import close_old_connections
+from asgiref.sync import sync_to_async
+
+from functools import wraps
+
+
+def async_view(view):
+
+    """
+        Async variant of DRF view for ASGI server.
+        Django 3.x has no async ORM and runs all sync views in one thread,
+        so view is executed with rendering in thread pool, every thread uses own database connection.
+    """
+
+    thread_sensitive = settings.ASYNC_VIEWS_THREAD_SENSITIVE
+
+    def run_view(request, *args, **kwargs):
+        # connections are closed by request signals only in main thread
+        if not thread_sensitive:
+            close_old_connections()
+        try:
+            response = view(request, *args, **kwargs)
+            # serializers are evaluated on rendering
+            if callable(getattr(response, 'render', None)):
+                response.render()
+            return response
+        finally:
+            if not thread_sensitive:
+                close_old_connections()
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await sync_to_async(run_view, thread_sensitive=thread_sensitive)(request, *args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from gallery_new.api.models import MediaFile, EntityFile, Quota
+from gallery_new.api.cache_stats import UserCacheStats
+
+import shutil
+import tempfile
+
+from .executors import run_image_task
+from .generators import hash_md5
+from .simlinks import create_symlink
+from .thumbnails import crop_image
+
+
+def normalize_avatar(media_file: MediaFile) -> bool:
+
+    """
+        Crop avatar to square not larger than MAX_AVATAR_SIZE.
+        Cropped file replaces original file of media file, original file is left to garbage collector.
+        Returns False if avatar wasn't changed.
+    """
+
+    original = media_file.entity_file
+
+    with tempfile.NamedTemporaryFile() as avatar_file:
+        # original file can be used by other media files, it is cropped in copy
+        with original.file.open('rb') as original_file:
+            shutil.copyfileobj(original_file, avatar_file)
+        avatar_file.flush()
+
+        avatar = run_image_task(crop_image, avatar_file.name, settings.MAX_AVATAR_SIZE)
+        if not avatar.get('cropped'):
+            return False
+
+        avatar_file.seek(0)
+        file_hash = hash_md5(avatar_file)
+        avatar_file.seek(0)
+        entity_file = EntityFile.objects.filter(hash=file_hash).first()
+        if not entity_file:
+            entity_file = EntityFile.objects.create(file=File(avatar_file, original.get_filename()), hash=file_hash)
+
+    size = entity_file.file.size
+    with transaction.atomic():
+        # media file could be deleted or normalized by another job
+        swapped = MediaFile.objects.filter(id=media_file.id, entity_file=original).update(
+            entity_file=entity_file,
+            size=size
+        )
+        if not swapped:
+            return False
+        EntityFile.change_refs([entity_file.id], 1)
+        EntityFile.change_refs([original.id], -1)
+        Quota.change_used(media_file.user_id, size - media_file.size)
+
+    UserCacheStats(media_file.user_id).invalidate()
+    media_file.entity_file, media_file.size = entity_file, size
+    create_symlink(entity_file.file.path, media_file.name, media_file.title)
+    return True
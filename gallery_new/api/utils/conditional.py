@@ -0,0 +1,38 @@
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+
+from gallery_new.api.models import Quota
+
+from functools import wraps
+
+
+def gallery_condition(method):
+
+    """
+        ETag and Last-Modified of user's gallery for read view method.
+        Version of gallery is kept in quota of user, it's the only query of not modified request:
+        If-None-Match requests get 304 before queryset, serializer or stats are computed.
+        If-Modified-Since is not used: Last-Modified has one second precision and changes made
+        in the same second as previous response would get 304.
+    """
+
+    @wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        quota, created = Quota.objects.get_or_create(user=request.user)
+        # loaded quota is used by view
+        request.user.quota = quota
+
+        # weak, body depends on renderer
+        etag = 'W/"{}-{}"'.format(request.user.id, quota.version)
+        last_modified = int(quota.modified_at.timestamp())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = method(view, request, *args, **kwargs)
+
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    return wrapper
@@ -0,0 +1,68 @@
+from django.db import transaction
+from gallery_new.api.models import MediaFile, EntityFile, Quota, MediaFileChange
+from gallery_new.api.cache_stats import UserCacheStats
+
+from collections import defaultdict
+from mimetypes import guess_type
+
+from .simlinks import create_symlinks
+
+BATCH_SIZE = 500
+
+
+def create_media_files(user_id: int, files: list) -> list:
+
+    """
+        Create media files for stored originals: (entity file, name).
+        Signals are not sent by bulk_create, so quota, references, stats, changes and symlinks
+        are updated once for all files like in delete_media_files.
+        Returns created media files with entity files.
+    """
+
+    media_files = []
+    for entity_file, name in files:
+        media_type, encoding = guess_type(name)
+        media_files.append(MediaFile(
+            entity_file=entity_file,
+            user_id=user_id,
+            name=name,
+            media_type=media_type or '',
+            size=entity_file.file.size
+        ))
+    if not media_files:
+        return []
+
+    # entity files with the same number of new references are updated by one query
+    references = defaultdict(int)
+    for media_file in media_files:
+        references[media_file.entity_file_id] += 1
+    entity_files = defaultdict(list)
+    for entity_file_id, count in references.items():
+        entity_files[count].append(entity_file_id)
+
+    with transaction.atomic():
+        MediaFile.objects.bulk_create(media_files, batch_size=BATCH_SIZE)
+        # ids are not returned by bulk_create on every database
+        media_files = list(MediaFile.objects.filter(
+            user_id=user_id, title__in=[media_file.title for media_file in media_files]
+        ).select_related('entity_file').order_by('id'))
+
+        Quota.change_used(user_id, sum(media_file.size for media_file in media_files))
+        for count, entity_ids in entity_files.items():
+            EntityFile.change_refs(entity_ids, count)
+        MediaFileChange.objects.bulk_create([
+            MediaFileChange(
+                user_id=user_id,
+                media_file_id=media_file.id,
+                is_avatar=False,
+                action=MediaFileChange.CREATED
+            )
+            for media_file in media_files
+        ], batch_size=BATCH_SIZE)
+
+    UserCacheStats(user_id).invalidate()
+
+    create_symlinks([
+        (media_file.entity_file.file.path, media_file.name, media_file.title) for media_file in media_files
+    ])
+    return media_files
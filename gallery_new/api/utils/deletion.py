@@ -0,0 +1,65 @@
+from django.db import transaction
+from gallery_new.api.models import MediaFile, EntityFile, Quota, MediaFileChange
+from gallery_new.api.cache_stats import UserCacheStats
+
+from collections import defaultdict
+
+from .simlinks import remove_symlinks
+
+BATCH_SIZE = 500
+
+
+def delete_media_files(queryset) -> int:
+
+    """
+        Delete media files with one quota update per user,
+        remove their symlinks, record deletions for delta sync and mark originals which are not used anymore.
+        Returns number of deleted media files.
+    """
+
+    media_files = list(queryset.order_by().values(
+        'id', 'title', 'user_id', 'size', 'entity_file_id', 'is_avatar'
+    ))
+    if not media_files:
+        return 0
+
+    used = defaultdict(int)
+    for media_file in media_files:
+        used[media_file['user_id']] += media_file['size']
+
+    # entity files with the same number of deleted references are updated by one query
+    references = defaultdict(int)
+    for media_file in media_files:
+        references[media_file['entity_file_id']] += 1
+    entity_files = defaultdict(list)
+    for entity_file_id, count in references.items():
+        entity_files[count].append(entity_file_id)
+
+    ids = [media_file['id'] for media_file in media_files]
+    with transaction.atomic():
+        for i in range(0, len(ids), BATCH_SIZE):
+            # DELETE without collecting rows and post_delete signals, their work is done once below.
+            # Media files have no dependent rows to cascade.
+            MediaFile.objects.filter(id__in=ids[i:i + BATCH_SIZE])._raw_delete(MediaFile.objects.db)
+        for user_id, size in used.items():
+            Quota.change_used(user_id, -size)
+        for count, entity_ids in entity_files.items():
+            for i in range(0, len(entity_ids), BATCH_SIZE):
+                EntityFile.change_refs(entity_ids[i:i + BATCH_SIZE], -count)
+        MediaFileChange.objects.bulk_create([
+            MediaFileChange(
+                user_id=media_file['user_id'],
+                media_file_id=media_file['id'],
+                is_avatar=media_file['is_avatar'],
+                action=MediaFileChange.DELETED
+            )
+            for media_file in media_files
+        ], batch_size=BATCH_SIZE)
+
+    for user_id in used:
+        UserCacheStats(user_id).invalidate()
+
+    # originals without media files are deleted by collect_garbage command
+    remove_symlinks([media_file['title'] for media_file in media_files])
+
+    return len(media_files)
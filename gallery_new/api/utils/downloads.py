@@ -0,0 +1,126 @@
+from django.conf import settings
+from django.http import HttpResponse, FileResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags
+
+from gallery_new.api.models import MediaFile
+
+from urllib.parse import quote
+import os
+import re
+
+RANGE_REGEX = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+BLOCK_SIZE = 65536
+
+
+def get_range(header: str, size: int):
+
+    """
+        Byte range (start, end) of Range header, end is inclusive.
+        Returns None for full file, multiple ranges are served as full file.
+        Raises ValueError if range is not satisfiable.
+        Example:
+            bytes=0-1023, bytes=1024-, bytes=-1024
+    """
+
+    match = RANGE_REGEX.match((header or '').strip())
+    if not match or not (match.group('start') or match.group('end')):
+        return None
+
+    start, end = match.group('start'), match.group('end')
+    if not start:
+        # suffix range, last bytes of file
+        length = int(end)
+        if not length or not size:
+            raise ValueError('Wrong Range')
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError('Wrong Range')
+    return start, end
+
+
+def get_etag(media_file: MediaFile) -> str:
+
+    """ Originals are never changed, so hash is a strong validator """
+
+    return '"{}"'.format(media_file.entity_file.hash)
+
+
+def read_range(path: str, start: int, end: int):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        left = end - start + 1
+        while left > 0:
+            buf = file.read(min(BLOCK_SIZE, left))
+            if not buf:
+                break
+            left -= len(buf)
+            yield buf
+
+
+def serve_file(request, path: str, content_type: str):
+
+    """ Range response streamed by Django, used without front server and by its stand-in in tests """
+
+    size = os.path.getsize(path)
+    try:
+        byte_range = get_range(request.META.get('HTTP_RANGE'), size)
+    except ValueError:
+        # clients of byte ranges expect real status
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(size)
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(read_range(path, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def sendfile_response(request, media_file: MediaFile):
+
+    """
+        Download response of media file according to SENDFILE_BACKEND:
+            nginx - X-Accel-Redirect to internal location SENDFILE_URL_PREFIX mapped to MEDIA_ROOT,
+            apache - X-Sendfile with file path (also lighttpd),
+            django - file is streamed by Django.
+        Front server handles Range by itself, conditional requests are handled here.
+    """
+
+    etag = get_etag(media_file)
+    last_modified = int(media_file.created_at.timestamp())
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(last_modified),
+        'Content-Disposition': "attachment; filename*=UTF-8''{}".format(quote(media_file.name)),
+        'Cache-Control': 'private, max-age={}'.format(settings.SENDFILE_MAX_AGE),
+    }
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        entity_file = media_file.entity_file
+        # range of changed file is not served
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range and etag not in parse_etags(if_range):
+            request.META.pop('HTTP_RANGE', None)
+
+        if settings.SENDFILE_BACKEND == 'nginx':
+            response = HttpResponse(content_type=media_file.media_type)
+            response['X-Accel-Redirect'] = settings.SENDFILE_URL_PREFIX + quote(entity_file.file.name)
+        elif settings.SENDFILE_BACKEND == 'apache':
+            response = HttpResponse(content_type=media_file.media_type)
+            response['X-Sendfile'] = entity_file.file.path
+        else:
+            response = serve_file(request, entity_file.file.path, media_file.media_type)
+
+    for header, value in headers.items():
+        response[header] = value
+    return response
@@ -40,3 +40,19 @@ class MailformedData(APIException):
         'status': status.HTTP_400_BAD_REQUEST,
         'error': 'Mailformed data'
     }
+
+
+class WrongOffset(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = {
+        'status': status.HTTP_409_CONFLICT,
+        'error': 'Wrong upload offset'
+    }
+
+
+class CursorExpired(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = {
+        'status': status.HTTP_410_GONE,
+        'error': 'Cursor expired'
+    }
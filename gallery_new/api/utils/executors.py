@@ -0,0 +1,61 @@
+from django.conf import settings
+
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from threading import Lock, BoundedSemaphore
+
+from .exceptions import TooManyRequests
+
+INLINE = 'inline'
+THREAD = 'thread'
+PROCESS = 'process'
+
+# executor of current process, created on first task
+_executor = None
+_slots = None
+_lock = Lock()
+
+
+def get_executor():
+    global _executor, _slots
+
+    with _lock:
+        if _executor is None:
+            if settings.IMAGE_EXECUTOR == PROCESS:
+                _executor = ProcessPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+            else:
+                _executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+            # running and waiting tasks
+            _slots = BoundedSemaphore(settings.IMAGE_WORKERS + settings.IMAGE_QUEUE_SIZE)
+        return _executor, _slots
+
+
+def shutdown_executor() -> None:
+
+    """ Stop workers, next task creates executor with current settings """
+
+    global _executor, _slots
+
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown()
+        _executor = _slots = None
+
+
+def run_image_task(func, *args, **kwargs):
+
+    """
+        Run CPU-bound image function by IMAGE_EXECUTOR and wait for result.
+        Function and arguments should be picklable for process executor.
+        Raises TooManyRequests if executor queue is full during IMAGE_QUEUE_TIMEOUT.
+    """
+
+    if settings.IMAGE_EXECUTOR == INLINE:
+        return func(*args, **kwargs)
+
+    executor, slots = get_executor()
+    if not slots.acquire(timeout=settings.IMAGE_QUEUE_TIMEOUT):
+        raise TooManyRequests
+    try:
+        return executor.submit(func, *args, **kwargs).result()
+    finally:
+        slots.release()
@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.utils import timezone
+from gallery_new.api.models import EntityFile
+
+from datetime import timedelta
+import time
+
+
+def get_stored_size(field_file) -> int:
+    try:
+        return field_file.storage.size(field_file.name) if field_file else 0
+    except OSError:
+        return 0
+
+
+def collect_garbage(batch_size: int = None, grace_period: int = None, max_batches: int = None) -> dict:
+
+    """
+        Delete original files (and their thumbnails) without media files.
+        Only files marked as orphaned more than grace_period seconds ago are checked,
+        by batches of batch_size files.
+        Returns metrics of run.
+    """
+
+    batch_size = batch_size or settings.GC_BATCH_SIZE
+    grace_period = settings.GC_GRACE_PERIOD if grace_period is None else grace_period
+    deadline = timezone.now() - timedelta(seconds=grace_period)
+    start = time.monotonic()
+
+    metrics = {
+        'batches': 0,
+        'originals': 0,
+        'thumbnails': 0,
+        'bytes': 0,
+        'seconds': 0,
+    }
+
+    last_id = 0
+    while max_batches is None or metrics['batches'] < max_batches:
+        ids = list(
+            EntityFile.objects.filter(orphaned_at__lte=deadline, id__gt=last_id)
+            .order_by('id').values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            break
+        metrics['batches'] += 1
+        last_id = ids[-1]
+
+        # check references again, media file could be created after marking
+        entity_files = list(
+            EntityFile.objects.filter(id__in=ids, mediafile=None).prefetch_related('thumbnail_set')
+        )
+        for entity_file in entity_files:
+            metrics['bytes'] += get_stored_size(entity_file.file)
+            for thumbnail in entity_file.thumbnail_set.all():
+                metrics['bytes'] += get_stored_size(thumbnail.file)
+                metrics['thumbnails'] += 1
+
+        # Check deleting files from storage in api/signals.py
+        deleted_ids = [entity_file.id for entity_file in entity_files]
+        EntityFile.objects.filter(id__in=deleted_ids, mediafile=None).delete()
+        metrics['originals'] += len(deleted_ids)
+
+        # files are used by media files, marker is wrong
+        EntityFile.objects.filter(id__in=ids).exclude(id__in=deleted_ids).update(orphaned_at=None)
+
+    metrics['seconds'] = round(time.monotonic() - start, 3)
+    return metrics
@@ -2,8 +2,10 @@ from pathlib import Path
 from datetime import timedelta, datetime
 from django.conf import settings
 from django.utils import timezone
+from django.urls import reverse, get_urlconf, get_script_prefix
 from uuid import uuid4
-from urllib.parse import urljoin
+from urllib.parse import urljoin, quote
+from functools import lru_cache
 from django.core.files.uploadedfile import TemporaryUploadedFile
 
 import hashlib
@@ -16,11 +18,64 @@ def generate_uuid():
     return str(uuid4())
 
 
+@lru_cache(maxsize=None)
+def get_static_prefix(static_link: str) -> str:
+
+    """ Base of files urls, STATIC_LINK is parsed once """
+
+    return urljoin(static_link, '.')
+
+
 def get_file_url(*path):
 
     """ generate correctly url """
 
-    return urljoin(settings.STATIC_LINK, str(Path(*path)))
+    return get_static_prefix(settings.STATIC_LINK) + '/'.join(quote(str(part), safe='') for part in path)
+
+
+def get_symlink_parts(title: str) -> list:
+
+    """
+        Path of media file symlinks directory, sharded by title prefix like originals by hash.
+        Example for SYMLINKS_SHARD_DEPTH = 2: ['Jy', 'Fo', 'JyFo5UscmKBj']
+    """
+
+    return [title[i * 2:i * 2 + 2] for i in range(settings.SYMLINKS_SHARD_DEPTH)] + [title]
+
+
+def get_symlink_url(title: str, name: str) -> str:
+    return get_file_url(*get_symlink_parts(title), name)
+
+
+@lru_cache(maxsize=None)
+def get_avatar_thumbnails_path(urlconf, script_prefix: str) -> str:
+
+    """ Path of lazy avatar thumbnails before slot id, reversed once for every urlconf """
+
+    return reverse('avatar_thumbnail', args=['0', 0], urlconf=urlconf)[:-len('0/0/')]
+
+
+def get_avatar_thumbnails_url(request) -> str:
+
+    """
+        Base of lazy avatar thumbnails urls, computed once for response.
+        Returns None if avatar thumbnails are rendered on uploading.
+    """
+
+    if not settings.AVATAR_THUMBS_LAZY:
+        return None
+    return request.build_absolute_uri(
+        get_avatar_thumbnails_path(get_urlconf() or settings.ROOT_URLCONF, get_script_prefix())
+    )
+
+
+def get_avatar_thumbnail_url(thumbnails_url: str, title: str, name: str, side_size: int) -> str:
+
+    """ Lazy avatar thumbnail is rendered on request to api, then api redirects to static file """
+
+    if thumbnails_url:
+        return '{}{}/{}/'.format(thumbnails_url, quote(title, safe=''), side_size)
+    return get_symlink_url(title, '%s_%s.webp' % (side_size, os.path.splitext(name)[0]))
 
 
 def get_upload_entity(instance, filename):
@@ -0,0 +1,179 @@
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from gallery_new.api.models import Job
+from gallery_new.api.utils.uploads import purge_expired_sessions
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import timedelta
+from threading import Thread, Event
+import logging
+import traceback
+import time
+
+
+logger = logging.getLogger(__name__)
+
+# task name / dotted path to function
+TASKS = {
+    'create_thumbnails': 'gallery_new.api.utils.tasks.create_thumbnails_task',
+    'normalize_avatar': 'gallery_new.api.utils.tasks.normalize_avatar_task',
+}
+
+
+def enqueue(task: str, **kwargs) -> Job:
+
+    """
+        Save job to database.
+        If JOBS_ASYNC is disabled job runs immediately in current process.
+    """
+
+    if task not in TASKS:
+        raise KeyError('Unknown task: {}'.format(task))
+
+    job = Job.objects.create(task=task, kwargs=kwargs)
+    if not settings.JOBS_ASYNC:
+        run_job(job)
+    return job
+
+
+def get_retry_delay(attempts: int) -> int:
+
+    """ Exponential backoff: JOBS_RETRY_DELAY, x2, x4... up to JOBS_RETRY_MAX_DELAY """
+
+    return min(settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1), settings.JOBS_RETRY_MAX_DELAY)
+
+
+class Heartbeat:
+
+    """
+        Refresh updated_at of running job every JOBS_HEARTBEAT seconds,
+        so job of alive worker is not returned to queue by requeue_stale_jobs.
+    """
+
+    def __init__(self, job_id: int, interval: float = None):
+        self.job_id = job_id
+        self.interval = interval or settings.JOBS_HEARTBEAT
+        self._stopped = Event()
+        self._thread = Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        try:
+            while not self._stopped.wait(self.interval):
+                Job.objects.filter(id=self.job_id, state=Job.RUNNING).update(updated_at=timezone.now())
+        finally:
+            connection.close()
+
+
+def run_job(job: Job) -> bool:
+
+    """
+        Execute job if it is still pending.
+        Returns False if job was claimed by another worker.
+    """
+
+    # claim job, only one worker can switch state from pending
+    claimed = Job.objects.filter(id=job.id, state=Job.PENDING).update(
+        state=Job.RUNNING,
+        attempts=F('attempts') + 1,
+        updated_at=timezone.now()
+    )
+    if not claimed:
+        return False
+    job.refresh_from_db()
+
+    try:
+        with Heartbeat(job.id):
+            import_string(TASKS[job.task])(**job.kwargs)
+    except Exception:
+        job.last_error = traceback.format_exc()
+        if job.attempts >= settings.JOBS_MAX_ATTEMPTS:
+            job.state = Job.FAILED
+        else:
+            job.state = Job.PENDING
+            job.run_at = timezone.now() + timedelta(seconds=get_retry_delay(job.attempts))
+    else:
+        job.state = Job.DONE
+        job.last_error = ''
+
+    job.save(update_fields=['state', 'last_error', 'run_at', 'updated_at'])
+    return True
+
+
+def requeue_stale_jobs() -> int:
+
+    """ Return to queue jobs of workers which were killed during execution """
+
+    stale_time = timezone.now() - timedelta(seconds=settings.JOBS_TIMEOUT)
+    return Job.objects.filter(state=Job.RUNNING, updated_at__lt=stale_time).update(state=Job.PENDING)
+
+
+def purge_done_jobs() -> int:
+    keep_time = timezone.now() - timedelta(seconds=settings.JOBS_KEEP_DONE)
+    deleted, rows = Job.objects.filter(state=Job.DONE, updated_at__lt=keep_time).delete()
+    return deleted
+
+
+def get_pending_jobs(limit: int, exclude: list = ()) -> list:
+    jobs = Job.objects.filter(state=Job.PENDING, run_at__lte=timezone.now()).exclude(id__in=exclude)
+    return list(jobs.order_by('run_at')[:limit])
+
+
+def _run_job_in_thread(job: Job) -> bool:
+    # every worker thread has own db connection
+    try:
+        return run_job(job)
+    finally:
+        connection.close()
+
+
+def run_worker(workers: int = None, poll_interval: float = None, once: bool = False) -> int:
+
+    """
+        Process jobs using bounded thread pool.
+        New jobs are taken as soon as any running job is finished.
+        If once is True worker stops when there are no pending and running jobs.
+        Returns number of processed jobs.
+    """
+
+    workers = workers or settings.JOBS_WORKERS
+    poll_interval = poll_interval or settings.JOBS_POLL_INTERVAL
+    processed = 0
+    # future / job id
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            requeue_stale_jobs()
+            if len(running) < workers:
+                # submitted jobs could be not claimed yet
+                for job in get_pending_jobs(workers - len(running), exclude=list(running.values())):
+                    running[executor.submit(_run_job_in_thread, job)] = job.id
+
+            if running:
+                done = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED).done
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        processed += future.result()
+                    except Exception:
+                        # database errors of claiming or saving the job, it's returned to queue after JOBS_TIMEOUT
+                        logger.exception('Error running job %s', job_id)
+            elif once:
+                break
+            else:
+                purge_done_jobs()
+                purge_expired_sessions()
+                time.sleep(poll_interval)
+
+    return processed
@@ -1,36 +1,26 @@
-from django.db.models import Sum
+from django.db.models import Sum, Count, Q
 from django.conf import settings
 from django.db.models.functions import Coalesce
-from pathlib import Path
 from gallery_new.api.models import MediaFile, Quota
+from gallery_new.api.cache_stats import UserCacheStats, STATS_CATEGORIES
 from .exceptions import MailformedData
-from .generators import get_file_url
+from .generators import get_symlink_url, get_avatar_thumbnail_url, get_avatar_thumbnails_url
 
 
 def file_upload_response(
         media_file: MediaFile,
         is_avatar: bool = False,
         avatar_thumbs: bool = False,
-        max_size: int = settings.MAX_AVATAR_SIZE
+        max_size: int = settings.MAX_AVATAR_SIZE,
+        request=None
 ) -> dict:
 
-    response = {
-        'id': media_file.id,
-        'size': media_file.size,
-        'media_type': media_file.media_type,
-        'name': media_file.name,
-        'slot_id': media_file.title,
-        'created_at': media_file.created_at,
-        'file': get_file_url(media_file.title, media_file.name),
-        'hash': media_file.entity_file.hash,
-        'thumbnail': {
-            'url':  get_file_url(media_file.title, 'thumb_%s' % media_file.name),
-            'width': settings.DEFAULT_THUMB_SIZE_TUPLE[0],
-            'height': settings.DEFAULT_THUMB_SIZE_TUPLE[1],
-        },
-        'used': media_file.user.quota.get_quota_used(),
-        'quota': media_file.user.quota.get_size
-    }
+    # used quota is updated in signals
+    quota = Quota.objects.get(user_id=media_file.user_id)
+
+    response = media_file_response(media_file)
+    response['used'] = quota.used
+    response['quota'] = quota.get_size
 
     # optional attrs
     if media_file.metadata:
@@ -42,10 +32,10 @@ def file_upload_response(
         response['is_avatar'] = True
 
         if avatar_thumbs:
-            thumb_name = Path(media_file.name).stem
+            thumbnails_url = get_avatar_thumbnails_url(request)
             response['thumbnails'] = [
                 {
-                    'url': get_file_url(media_file.title, '%s_%s.webp' % (size, thumb_name)),
+                    'url': get_avatar_thumbnail_url(thumbnails_url, media_file.title, media_file.name, size),
                     'width': size,
                     'height': size,
                 } for size in settings.THUMBS_SIZE_LIST if size < max_size
@@ -54,6 +44,24 @@ def file_upload_response(
     return response
 
 
+def media_file_response(media_file: MediaFile) -> dict:
+    return {
+        'id': media_file.id,
+        'size': media_file.size,
+        'media_type': media_file.media_type,
+        'name': media_file.name,
+        'slot_id': media_file.title,
+        'created_at': media_file.created_at,
+        'file': get_symlink_url(media_file.title, media_file.name),
+        'hash': media_file.entity_file.hash,
+        'thumbnail': {
+            'url':  get_symlink_url(media_file.title, 'thumb_%s' % media_file.name),
+            'width': settings.DEFAULT_THUMB_SIZE_TUPLE[0],
+            'height': settings.DEFAULT_THUMB_SIZE_TUPLE[1],
+        },
+    }
+
+
 def get_quota_response(quota: Quota) -> dict:
     response = {
         'quota': quota.get_size,
@@ -62,37 +70,38 @@ def get_quota_response(quota: Quota) -> dict:
     return response
 
 
-def stats_response(media_files, quota: int) -> dict:
+def aggregate_stats(media_files) -> dict:
 
-    images = media_files.filter(media_type__startswith='image')
-    videos = media_files.filter(media_type__startswith='video')
-    voices = media_files.filter(media_type__startswith='voice')
-    files = media_files.filter(media_type__startswith='file')
+    """ Count files and used size for every category in one query """
 
-    response = {
-        'images': {
-            'count': images.count(),
-            'used': images.aggregate(size=Coalesce(Sum('size'), 0)).get('size')
-        },
-        'videos': {
-            'count': videos.count(),
-            'used': videos.aggregate(size=Coalesce(Sum('size'), 0)).get('size')
-        },
-        'voices': {
-            'count': voices.count(),
-            'used': voices.aggregate(size=Coalesce(Sum('size'), 0)).get('size')
-        },
-        'files': {
-            'count': files.count(),
-            'used': files.aggregate(size=Coalesce(Sum('size'), 0)).get('size')
-        },
-        'total': {
-            'count': media_files.count(),
-            'used': media_files.aggregate(size=Coalesce(Sum('size'), 0)).get('size')
-        },
-        'quota': quota
+    aggregation = {
+        'total_count': Count('id'),
+        'total_used': Coalesce(Sum('size'), 0),
     }
+    for category, prefix in STATS_CATEGORIES.items():
+        condition = Q(media_type__startswith=prefix)
+        aggregation[category + '_count'] = Count('id', filter=condition)
+        aggregation[category + '_used'] = Coalesce(Sum('size', filter=condition), 0)
+
+    result = media_files.aggregate(**aggregation)
+    return {
+        category: {
+            'count': result[category + '_count'],
+            'used': result[category + '_used']
+        } for category in list(STATS_CATEGORIES) + ['total']
+    }
+
+
+def stats_response(user) -> dict:
+
+    user_cache = UserCacheStats(user.id)
+    stats = user_cache.stats
+    if not stats:
+        stats = aggregate_stats(MediaFile.objects.filter(user=user))
+        user_cache.stats = stats
 
+    response = dict(stats)
+    response['quota'] = user.quota.get_size
     return response
 
 
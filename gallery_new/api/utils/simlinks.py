@@ -1,11 +1,173 @@
+from collections import defaultdict
+from contextlib import contextmanager
 from pathlib import Path
+from shutil import rmtree
 from django.conf import settings
 
+import fcntl
+import json
+import os
+
+from .generators import get_symlink_parts
+
+# append-only log of created and removed symlinks, one for every top level shard
+MANIFEST_NAME = '.manifest'
+# appends and compaction of manifest are serialized by lock of this file, manifest itself is replaced
+LOCK_NAME = '.manifest.lock'
+
+
+def get_symlinks_root() -> Path:
+    return Path(settings.MEDIA_ROOT, settings.SYMLINKS_DIR)
+
+
+def get_symlink_dir(title: str) -> Path:
+
+    """ Directory of media file symlinks, sharded by title prefix """
+
+    return Path(get_symlinks_root(), *get_symlink_parts(title))
+
+
+def get_manifest_path(title: str) -> Path:
+    return Path(get_symlinks_root(), *get_symlink_parts(title)[:-1][:1], MANIFEST_NAME)
+
+
+def get_manifest_paths() -> list:
+
+    """
+        Manifests of current layout.
+        Only top level shards are listed, directories of media files are not walked.
+    """
+
+    root = get_symlinks_root()
+    if not settings.SYMLINKS_SHARD_DEPTH:
+        return [Path(root, MANIFEST_NAME)]
+    if not root.exists():
+        return []
+    return [Path(root, shard, MANIFEST_NAME) for shard in sorted(os.listdir(root)) if Path(root, shard).is_dir()]
+
+
+@contextmanager
+def lock_manifest(path: Path):
+
+    """ Exclusive lock of manifest shared by processes """
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_name(LOCK_NAME), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def append_manifest(records: list) -> None:
+
+    """
+        Record symlinks changes: ['+', title, name] for created symlink, ['-', title, name] for removed one,
+        ['-', title] for removed directory.
+        Every manifest is written once under lock, so appends are not lost by concurrent compaction.
+    """
+
+    lines = defaultdict(list)
+    for record in records:
+        lines[get_manifest_path(record[1])].append(json.dumps(record) + '\n')
+
+    for path, manifest_lines in lines.items():
+        with lock_manifest(path):
+            with open(path, 'a', encoding='utf-8') as manifest:
+                manifest.write(''.join(manifest_lines))
+
+
+def read_manifest(path: Path) -> dict:
+
+    """ Current symlinks of manifest: {title: set of names} """
+
+    symlinks = {}
+    if not path.exists():
+        return symlinks
+
+    with open(path, encoding='utf-8') as manifest:
+        for line in manifest:
+            try:
+                op, title, *name = json.loads(line)
+            except ValueError:
+                # line could be cut by crash
+                continue
+            if op == '+':
+                symlinks.setdefault(title, set()).add(name[0])
+            elif name:
+                symlinks.get(title, set()).discard(name[0])
+            else:
+                symlinks.pop(title, None)
+    return symlinks
+
+
+def compact_manifest(path: Path) -> dict:
+
+    """
+        Replace manifest log with current symlinks.
+        Manifest is read and replaced under lock, appends wait for it.
+        Returns current symlinks.
+    """
+
+    with lock_manifest(path):
+        symlinks = read_manifest(path)
+        tmp_path = path.with_name(MANIFEST_NAME + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as manifest:
+            for title, names in sorted(symlinks.items()):
+                for name in sorted(names):
+                    manifest.write(json.dumps(['+', title, name]) + '\n')
+        os.replace(tmp_path, path)
+    return symlinks
+
+
+def create_symlinks(links: list) -> None:
+
+    """
+        Create symlinks in batch: (source path, symlink name, media file title).
+        Directory is created once for every title, manifests are written once.
+    """
+
+    created_dirs = set()
+    records = []
+    for path, file_name, title in links:
+        symlink_dir = get_symlink_dir(title)
+        if symlink_dir not in created_dirs:
+            symlink_dir.mkdir(parents=True, exist_ok=True)
+            created_dirs.add(symlink_dir)
+
+        symlink = os.path.join(symlink_dir, file_name)
+        try:
+            os.symlink(path, symlink)
+        except FileExistsError:
+            # recreate symlink when job is retried
+            os.unlink(symlink)
+            os.symlink(path, symlink)
+        records.append(['+', title, file_name])
+
+    append_manifest(records)
+
 
 def create_symlink(path: str, file_name: str, title: str) -> None:
+    create_symlinks([(path, file_name, title)])
+
+
+def remove_symlinks(titles: list) -> None:
+
+    """ Remove symlink directories of media files """
+
+    for title in titles:
+        rmtree(get_symlink_dir(title), ignore_errors=True)
+    append_manifest([['-', title] for title in titles])
+
+
+def remove_symlink_files(links: list) -> None:
+
+    """ Remove single symlinks: (media file title, symlink name) """
 
-    symlink_dir = Path(settings.MEDIA_ROOT, settings.SYMLINKS_DIR, title)
-    if not symlink_dir.exists():
-        symlink_dir.mkdir(parents=True)
-    src_path = Path(path)
-    Path(symlink_dir, file_name).symlink_to(src_path)
\ No newline at end of file
+    for title, file_name in links:
+        try:
+            os.unlink(os.path.join(get_symlink_dir(title), file_name))
+        except FileNotFoundError:
+            pass
+    append_manifest([['-', title, file_name] for title, file_name in links])
@@ -0,0 +1,29 @@
+from gallery_new.api.models import MediaFile, Quota
+from .thumbnails import create_thumbnails
+from .avatars import normalize_avatar
+
+
+def create_thumbnails_task(media_file_id: int, is_avatar: bool = False, avatar_thumbs: bool = False) -> None:
+
+    """ Background job: create thumbnails for uploaded media file """
+
+    media_file = MediaFile.objects.select_related('entity_file').filter(id=media_file_id).first()
+
+    # media file could be deleted before job started
+    if media_file:
+        create_thumbnails(media_file, is_avatar=is_avatar, avatar_thumbs=avatar_thumbs)
+        # thumbnails are listed with avatars
+        if is_avatar:
+            Quota.change_version([media_file.user_id])
+
+
+def normalize_avatar_task(media_file_id: int, avatar_thumbs: bool = False) -> None:
+
+    """ Background job: crop uploaded avatar, then create its thumbnails """
+
+    media_file = MediaFile.objects.select_related('entity_file').filter(id=media_file_id).first()
+
+    if media_file:
+        normalize_avatar(media_file)
+        create_thumbnails(media_file, is_avatar=True, avatar_thumbs=avatar_thumbs)
+        Quota.change_version([media_file.user_id])
@@ -2,101 +2,330 @@ from PIL import Image, ImageOps
 from io import BytesIO
 from django.core.files.base import ContentFile
 from typing import Tuple
+import math
 import av
-from ..models import EntityFile, Thumbnail, MediaFile
+from ..models import EntityFile, Thumbnail, MediaFile, Counter
 from pathlib import Path
 from django.conf import settings
-from .simlinks import create_symlink
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .simlinks import create_symlink, create_symlinks, remove_symlink_files
+from .executors import run_image_task
 
 
-def create_image_thumb(upload: str, name: str) -> Tuple[str, ContentFile]:
-    image = Image.open(upload)
-    im = ImageOps.fit(image, settings.DEFAULT_THUMB_SIZE_TUPLE)
-    thumb_io = BytesIO()
-    im.save(thumb_io, image.format, quality=60)
-    return "thumb_{}".format(name), ContentFile(thumb_io.getvalue(), name)
+def get_or_create_thumbnail(entity_file: EntityFile, **kwargs) -> Tuple[Thumbnail, bool]:
 
+    """ get_or_create which doesn't fail on duplicates created by concurrent jobs """
 
-def create_video_thumb(upload: str, name: str) -> Tuple[str, ContentFile]:
-    container = av.open(upload)
-    frame = next(container.decode(video=0))
-    fimage = frame.to_image()
-    im = ImageOps.fit(fimage, settings.DEFAULT_THUMB_SIZE_TUPLE)
-    thumb_io = BytesIO()
-    im.save(thumb_io, im.format, quality=60)
-    return "thumb_{}".format(name), ContentFile(thumb_io.getvalue(), name)
+    thumbnail = entity_file.thumbnail_set.filter(**kwargs).order_by('id').first()
+    if thumbnail:
+        return thumbnail, False
+    return entity_file.thumbnail_set.create(**kwargs), True
 
 
-def create_avatar_thumbs(entity_file: EntityFile, media_file: MediaFile) -> list:
+# stored size of avatar thumbnails files
+AVATAR_THUMBS_USED = 'avatar_thumbs_used'
+
+
+def save_thumbnail(thumbnail: Thumbnail, name: str, content: bytes, content_name: str) -> None:
+    if thumbnail.is_avatar:
+        Counter.change(AVATAR_THUMBS_USED, len(content) - (thumbnail.size if thumbnail.file else 0))
+    thumbnail.size = len(content)
+    thumbnail.file.save(name, ContentFile(content, content_name))
+
+
+def get_image_size(path: str) -> Tuple[int, int]:
+
+    """ Read image size from header without decoding """
+
+    with Image.open(path) as image:
+        return image.size
+
+
+def encode_image(image: Image, format: str, **params) -> bytes:
+    image_io = BytesIO()
+    image.save(image_io, format, **params)
+    return image_io.getvalue()
+
+
+def build_pyramid(image: Image, sizes: list) -> dict:
+
+    """
+        Resize square image to every size, each size is downsampled from the next larger one.
+        First step reduces image by integer factor before resampling.
+    """
+
+    pyramid = {}
+    current = image
+    for size in sorted(sizes, reverse=True):
+        current = current.resize((size, size), Image.BICUBIC, reducing_gap=2.0)
+        pyramid[size] = current
+    return pyramid
+
+
+def render_image_thumbnails(path: str, thumb_size: Tuple[int, int] = None, side_sizes: list = ()) -> dict:
+
+    """
+        Decode image once and render default thumbnail and avatar sizes.
+        JPEG is decoded at the smallest scale which is not less than requested sizes.
+        Returns dict: 'thumb' or side size / encoded image.
+    """
+
+    rendered = {}
+    with Image.open(path) as image:
+        format = image.format
+        draft_width, draft_height = thumb_size or (0, 0)
+        max_side = max(side_sizes, default=0)
+        image.draft(image.mode, (max(draft_width, max_side), max(draft_height, max_side)))
+        image.load()
+
+        if thumb_size:
+            rendered['thumb'] = encode_image(ImageOps.fit(image, thumb_size), format, quality=60)
+
+        for size, resized in build_pyramid(image, side_sizes).items():
+            rendered[size] = encode_image(resized, 'webp', quality=100, lossless=True, method=1)
+
+    return rendered
+
+
+def get_cover_size(size: Tuple[int, int], thumb_size: Tuple[int, int]) -> Tuple[int, int]:
+
+    """ Smallest size with the same aspect ratio which covers thumb_size """
+
+    scale = max(thumb_size[0] / size[0], thumb_size[1] / size[1])
+    return max(thumb_size[0], math.ceil(size[0] * scale)), max(thumb_size[1], math.ceil(size[1] * scale))
+
+
+def render_video_thumbnail(path: str, thumb_size: Tuple[int, int], position: float = None) -> bytes:
+
+    """
+        Decode keyframe nearest before position (seconds) and render thumbnail.
+        Frame is scaled on conversion to image, then cropped to thumb_size.
+    """
+
+    position = settings.VIDEO_THUMB_POSITION if position is None else position
+
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        stream.codec_context.thread_type = 'AUTO'
+        stream.codec_context.skip_frame = 'NONKEY'
+
+        # short video, take keyframe from the middle
+        if container.duration:
+            position = min(position, container.duration / av.time_base / 2)
+        if position > 0 and stream.time_base:
+            try:
+                container.seek(int(position / stream.time_base), stream=stream)
+            except av.error.FFmpegError:
+                container.seek(0)
+
+        frame = next(container.decode(stream))
+        width, height = get_cover_size((frame.width, frame.height), thumb_size)
+        image = frame.to_image(width=width, height=height)
+
+    left, top = (width - thumb_size[0]) // 2, (height - thumb_size[1]) // 2
+    image = image.crop((left, top, left + thumb_size[0], top + thumb_size[1]))
+    return encode_image(image, 'jpeg', quality=60)
+
+
+def create_image_thumbnails(entity_file: EntityFile, media_file: MediaFile, avatar_thumbs: bool = False) -> None:
+
+    """ Render missing thumbnails from one decoded image, then save them and create symlinks """
+
     name = Path(entity_file.file.name).stem
-    symlink_name = Path(media_file.name).stem
-    image = Image.open(entity_file.file)
-    for size in settings.THUMBS_SIZE_LIST:
-        if image.size[0] > size:
-            thumbnail, created = entity_file.thumbnail_set.get_or_create(
-                is_avatar=True,
-                side_size=size
-            )
-            if created:
-                thumbnail.file.save(*resize_avatar(image, name, size))
-            create_symlink(
-                path=thumbnail.file.path,
-                file_name="{}_{}.webp".format(size, symlink_name),
-                title=media_file.title,
-            )
 
+    thumbnails = {'thumb': get_or_create_thumbnail(entity_file, is_avatar=False)}
+    if avatar_thumbs:
+        width, height = get_image_size(entity_file.file.path)
+        for size in settings.THUMBS_SIZE_LIST:
+            if width > size:
+                thumbnails[size] = get_or_create_thumbnail(entity_file, is_avatar=True, side_size=size)
 
-def resize_avatar(image: Image, name: str, size: int) -> Tuple[str, ContentFile]:
-    img = image.resize((size, size))
-    thumb_io = BytesIO()
-    img.save(thumb_io, 'webp', quality=100, lossless=True, method=1)
-    return '{}_{}'.format(size, name), ContentFile(thumb_io.getvalue(), name)
+    # lazy avatar sizes are rendered on request
+    missing = [
+        key for key, (thumbnail, created) in thumbnails.items()
+        if (created or not thumbnail.file) and (key == 'thumb' or not settings.AVATAR_THUMBS_LAZY)
+    ]
+    if missing:
+        rendered = run_image_task(
+            render_image_thumbnails,
+            entity_file.file.path,
+            thumb_size=settings.DEFAULT_THUMB_SIZE_TUPLE if 'thumb' in missing else None,
+            side_sizes=[key for key in missing if key != 'thumb']
+        )
+        for key in missing:
+            thumbnail, created = thumbnails[key]
+            if key == 'thumb':
+                file_name = entity_file.get_filename()
+                save_thumbnail(thumbnail, 'thumb_{}'.format(file_name), rendered[key], file_name)
+            else:
+                save_thumbnail(thumbnail, '{}_{}'.format(key, name), rendered[key], name)
 
+    create_symlinks([
+        (
+            thumbnail.file.path,
+            'thumb_{}'.format(media_file.name) if key == 'thumb' else get_avatar_symlink_name(media_file, key),
+            media_file.title
+        )
+        for key, (thumbnail, created) in thumbnails.items() if thumbnail.file
+    ])
 
-def create_thumbnails(media_file: MediaFile, is_avatar: bool = False, avatar_thumbs: bool = False) -> None:
 
-    """ Create thumbnails and symlinks for media file """
+def get_avatar_symlink_name(media_file: MediaFile, side_size: int) -> str:
+    return '{}_{}.webp'.format(side_size, Path(media_file.name).stem)
+
+
+def allow_avatar_render(client: str) -> bool:
+
+    """
+        Lazy sizes are rendered for anonymous clients, evicted sizes could be requested again and again.
+        Client gets AVATAR_THUMBS_RENDER_LIMIT renders per AVATAR_THUMBS_RENDER_WINDOW seconds,
+        stored thumbnails are not limited.
+    """
 
-    # try, except for using threading
+    key = 'ar_{}'.format(client)
+    if cache.add(key, 1, timeout=settings.AVATAR_THUMBS_RENDER_WINDOW):
+        return True
     try:
-        entity_file = media_file.entity_file
-        media_type, format = media_file.media_type.split('/')
+        return cache.incr(key) <= settings.AVATAR_THUMBS_RENDER_LIMIT
+    except ValueError:
+        # window is expired
+        cache.add(key, 1, timeout=settings.AVATAR_THUMBS_RENDER_WINDOW)
+        return True
 
-        if media_type in ['image', 'video']:
 
-            thumbnail, created = Thumbnail.objects.get_or_create(
-                entity_file=entity_file,
-                is_avatar=False
-            )
+def render_avatar_thumbnail(media_file: MediaFile, thumbnail: Thumbnail) -> None:
+
+    """ Render lazy avatar thumbnail on first request, then keep thumbnails store in budget """
+
+    entity_file = media_file.entity_file
+    name = Path(entity_file.file.name).stem
+    rendered = run_image_task(render_image_thumbnails, entity_file.file.path, side_sizes=[thumbnail.side_size])
+
+    with transaction.atomic():
+        # file is saved once by concurrent first requests
+        locked = Thumbnail.objects.select_for_update().get(id=thumbnail.id)
+        locked.accessed_at = timezone.now()
+        if locked.file:
+            locked.save(update_fields=['accessed_at'])
+        else:
+            save_thumbnail(locked, '{}_{}'.format(thumbnail.side_size, name), rendered[thumbnail.side_size], name)
+
+    create_symlink(
+        path=locked.file.path,
+        file_name=get_avatar_symlink_name(media_file, thumbnail.side_size),
+        title=media_file.title,
+    )
+    evict_avatar_thumbnails(settings.AVATAR_THUMBS_CACHE_SIZE, keep=locked)
+
+
+def evict_avatar_thumbnails(max_size: int, keep: Thumbnail = None) -> int:
+
+    """
+        Delete files of least recently requested avatar thumbnails over max_size bytes, except keep.
+        Rows are kept, evicted size is rendered again on next request.
+        Returns number of evicted thumbnails.
+    """
+
+    used = Counter.get_value(AVATAR_THUMBS_USED)
+    if used <= max_size:
+        return 0
+
+    thumbnails = Thumbnail.objects.filter(is_avatar=True).exclude(file='')
+    if keep is not None:
+        thumbnails = thumbnails.exclude(id=keep.id)
+
+    evicted = 0
+    for thumbnail in thumbnails.order_by(F('accessed_at').asc(nulls_first=True), 'id').iterator():
+        if used <= max_size:
+            break
+        # thumbnail could be evicted or rendered again by concurrent request
+        if not Thumbnail.objects.filter(id=thumbnail.id, file=thumbnail.file.name).update(
+            file='', size=0, accessed_at=None
+        ):
+            continue
+        thumbnail.file.delete(save=False)
+        Counter.change(AVATAR_THUMBS_USED, -thumbnail.size)
+        # symlinks of all avatars with this original
+        remove_symlink_files([
+            (media_file.title, get_avatar_symlink_name(media_file, thumbnail.side_size))
+            for media_file in MediaFile.objects.filter(
+                entity_file_id=thumbnail.entity_file_id, is_avatar=True
+            ).only('title', 'name')
+        ])
+        used -= thumbnail.size
+        evicted += 1
+    return evicted
+
 
-            if created:
-                if media_type == 'image':
-                    thumb = create_image_thumb(entity_file.file, entity_file.get_filename())
-                else:
-                    thumb = create_video_thumb(entity_file.file, entity_file.get_filename())
-                thumbnail.file.save(*thumb)
-
-            create_symlink(
-                path=thumbnail.file.path,
-                file_name='thumb_{}'.format(media_file.name),
-                title=media_file.title,
+def has_thumbnails(media_type: str) -> bool:
+
+    """ Thumbnails are created for image/* and video/*, other and malformed media types are skipped """
+
+    parts = (media_type or '').split('/')
+    return len(parts) == 2 and parts[0] in ('image', 'video')
+
+
+def create_thumbnails(media_file: MediaFile, is_avatar: bool = False, avatar_thumbs: bool = False) -> None:
+
+    """
+        Create thumbnails and symlinks for media file.
+        Runs in background job, exceptions are handled by job runner.
+    """
+
+    if not has_thumbnails(media_file.media_type):
+        return
+
+    entity_file = media_file.entity_file
+    media_type, format = media_file.media_type.split('/')
+
+    if media_type == 'image':
+        create_image_thumbnails(entity_file, media_file, avatar_thumbs=is_avatar and avatar_thumbs)
+
+    elif media_type == 'video':
+
+        thumbnail, created = get_or_create_thumbnail(entity_file, is_avatar=False)
+
+        if created or not thumbnail.file:
+            file_name = entity_file.get_filename()
+            rendered = run_image_task(
+                render_video_thumbnail,
+                entity_file.file.path,
+                settings.DEFAULT_THUMB_SIZE_TUPLE,
+                settings.VIDEO_THUMB_POSITION
             )
+            save_thumbnail(thumbnail, 'thumb_{}'.format(file_name), rendered, file_name)
+
+        create_symlink(
+            path=thumbnail.file.path,
+            file_name='thumb_{}'.format(media_file.name),
+            title=media_file.title,
+        )
+
+
+def get_avatar_size(size: Tuple[int, int], max_size: int) -> Tuple[int, bool]:
+
+    """ Side of normalized avatar and whether image should be cropped to it """
+
+    width, height = size
+    if width == height and width < max_size:
+        return width, False
+    max_dim, min_dim, = (width, height) if width > height else (height, width)
+    return max_size if max_dim >= max_size else min_dim, True
+
 
-        if is_avatar and avatar_thumbs and media_type == 'image':
-            create_avatar_thumbs(entity_file, media_file)
-    except Exception as e:
-        print(e)
+def crop_image(path: str, max_size: int) -> dict:
 
+    """ Crop image to square not larger than max_size, cropped image replaces file """
 
-def crop_avatar(file: Image) -> dict:
-    image = Image.open(file)
-    width, height = image.size
-    new_size = width
-    if not width == height or width >= settings.MAX_AVATAR_SIZE:
-        max_dim, min_dim, = (width, height) if width > height else (height, width)
-        new_size = settings.MAX_AVATAR_SIZE if max_dim >= settings.MAX_AVATAR_SIZE else min_dim
+    image = Image.open(path)
+    new_size, cropped = get_avatar_size(image.size, max_size)
+    if cropped:
         img = ImageOps.fit(image, (new_size, new_size))
-        img.save(file.temporary_file_path())
+        img.save(path, image.format)
     return {
-        "max_size": new_size
+        "max_size": new_size,
+        "cropped": cropped
     }
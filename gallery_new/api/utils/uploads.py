@@ -0,0 +1,127 @@
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+from gallery_new.api.models import UploadSession
+
+from collections import OrderedDict
+from datetime import timedelta
+from threading import Lock
+from pathlib import Path
+import hashlib
+import re
+
+from .generators import hash_md5
+
+CONTENT_RANGE_REGEX = re.compile(r'^bytes (?P<start>\d+)-(?P<end>\d+)/(?P<total>\d+|\*)$')
+BLOCK_SIZE = 65536
+
+# Hashes of staging files computed on receiving: session_id / (offset, md5).
+# Chunks can be received by another process, then hash is computed on finishing.
+MAX_HASHES = 1000
+_hashes = OrderedDict()
+_hashes_lock = Lock()
+
+
+class StagedFile(File):
+
+    """ Staging file is moved to storage instead of copying """
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def create_staging_file(session: UploadSession) -> None:
+    path = Path(session.get_staging_path())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.touch()
+    _set_hash(session.session_id, 0, hashlib.md5())
+
+
+def delete_staging_file(session: UploadSession) -> None:
+    forget_staging_hash(session)
+    path = Path(session.get_staging_path())
+    if path.exists():
+        path.unlink()
+
+
+def purge_expired_sessions() -> int:
+
+    """
+        Delete not finished uploads older than UPLOAD_SESSION_LIFETIME.
+        Staging files are deleted by post_delete signal. Returns number of deleted sessions.
+    """
+
+    expired = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_LIFETIME)
+    deleted, rows = UploadSession.objects.filter(updated_at__lt=expired).delete()
+    return deleted
+
+
+def get_range_start(content_range: str, default: int) -> int:
+
+    """
+        Get first byte position from Content-Range header
+        Example:
+            bytes 0-1023/4096
+    """
+
+    if not content_range:
+        return default
+    match = CONTENT_RANGE_REGEX.match(content_range.strip())
+    if not match:
+        raise ValueError('Wrong Content-Range')
+    return int(match.group('start'))
+
+
+def write_chunk(session: UploadSession, stream, start: int, length: int) -> int:
+
+    """
+        Write chunk to staging file from position start.
+        Returns number of received bytes, it can be less than length if connection was dropped.
+    """
+
+    # take hash, concurrent request for the same session will not update it
+    with _hashes_lock:
+        offset, md5 = _hashes.pop(session.session_id, (None, None))
+    # chunk continues hashed data
+    if offset != start:
+        md5 = None
+
+    received = 0
+    with open(session.get_staging_path(), 'r+b') as staging_file:
+        staging_file.seek(start)
+        while received < length:
+            buf = stream.read(min(BLOCK_SIZE, length - received))
+            if not buf:
+                break
+            staging_file.write(buf)
+            received += len(buf)
+            if md5:
+                md5.update(buf)
+
+    if md5:
+        _set_hash(session.session_id, start + received, md5)
+    return received
+
+
+def get_staging_hash(session: UploadSession) -> str:
+    with _hashes_lock:
+        offset, md5 = _hashes.get(session.session_id, (None, None))
+    if offset == session.size:
+        return md5.hexdigest()
+
+    # chunks were received by another process
+    with open(session.get_staging_path(), 'rb') as staging_file:
+        return hash_md5(staging_file)
+
+
+def forget_staging_hash(session: UploadSession) -> None:
+    with _hashes_lock:
+        _hashes.pop(session.session_id, None)
+
+
+def _set_hash(session_id: str, offset: int, md5) -> None:
+    with _hashes_lock:
+        _hashes[session_id] = (offset, md5)
+        _hashes.move_to_end(session_id)
+        while len(_hashes) > MAX_HASHES:
+            _hashes.popitem(last=False)
@@ -0,0 +1,209 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from queue import Queue, Empty, Full
+import logging
+from threading import Thread, Lock
+import time
+import xmpp
+
+cache = caches['default']
+logger = logging.getLogger(__name__)
+
+# delivery counters are kept in Django cache, counters of all processes are summed only by shared cache (memcached, redis)
+METRICS = ['queued', 'dropped', 'sent', 'failed', 'reconnects', 'batches', 'latency_ms']
+
+_sender = None
+_sender_lock = Lock()
+
+
+def build_code_packet(code: str, srecipient: str, stanza_id: str, stanza_type: str, url: str) -> xmpp.Protocol:
+
+    """ Verification code stanza """
+
+    recipient = xmpp.protocol.JID(srecipient)
+    if stanza_type == 'message':
+        packet = xmpp.protocol.Message(recipient, 'Verification code is {}'.format(code),
+                                       'chat', payload=[xmpp.protocol.Node('urn:xmpp:hints no-store')])
+        if recipient.getResource():
+            packet.addChild(name='private', namespace='urn:xmpp:carbons:2')
+            packet.addChild(name='no-copy', namespace='urn:xmpp:hints')
+    else:
+        packet = xmpp.protocol.Iq(typ='get', to=recipient)
+
+    packet.addChild(name='confirm', attrs={'id': code, 'url': url},
+                    namespace='http://jabber.org/protocol/http-auth')
+    packet.setAttr('id', stanza_id)
+    return packet
+
+
+def increase_metric(name: str, value: int = 1) -> None:
+    key = 'xmpp_{}'.format(name)
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, value)
+    except ValueError:
+        # key was evicted between add and incr
+        cache.set(key, value, timeout=None)
+
+
+def get_metrics() -> dict:
+    values = cache.get_many(['xmpp_{}'.format(name) for name in METRICS])
+    metrics = {name: values.get('xmpp_{}'.format(name), 0) for name in METRICS}
+    metrics['latency_avg_ms'] = round(metrics['latency_ms'] / metrics['sent'], 1) if metrics['sent'] else 0
+    return metrics
+
+
+def create_client(domain: str):
+    return xmpp.Client(domain, debug=[])
+
+
+class XmppSender:
+
+    """
+        Sends verification codes through one authenticated XMPP connection.
+        Codes are queued by requests and sent by background thread in batches,
+        connection is restored on errors and kept alive with whitespace pings.
+    """
+
+    def __init__(self, jid: str, password: str, client_factory=create_client,
+                 queue_size: int = None, batch_size: int = None, reconnect_delay: float = None,
+                 keepalive: float = None):
+        self.jid = jid
+        self.password = password
+        self.client_factory = client_factory
+        self.batch_size = batch_size or settings.XMPP_SENDER_BATCH_SIZE
+        self.reconnect_delay = settings.XMPP_SENDER_RECONNECT_DELAY if reconnect_delay is None else reconnect_delay
+        self.keepalive = keepalive or settings.XMPP_SENDER_KEEPALIVE
+        self.queue = Queue(maxsize=queue_size or settings.XMPP_SENDER_QUEUE_SIZE)
+        self._client = None
+        self._thread = None
+        self._lock = Lock()
+
+    def send_code(self, code: str, recipient: str, stanza_id: str, stanza_type: str, url: str) -> bool:
+
+        """ Queue verification code, returns False if queue is full """
+
+        self.start()
+        try:
+            self.queue.put_nowait((time.monotonic(), (code, recipient, stanza_id, stanza_type, url)))
+        except Full:
+            increase_metric('dropped')
+            return False
+        increase_metric('queued')
+        return True
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+
+        """ Send queued codes and disconnect """
+
+        with self._lock:
+            thread = self._thread
+        if thread and thread.is_alive():
+            self.queue.put(None)
+            thread.join()
+
+    def _run(self) -> None:
+        while True:
+            try:
+                item = self.queue.get(timeout=self.keepalive)
+            except Empty:
+                self._ping()
+                continue
+
+            batch = []
+            while item is not None:
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self.queue.get_nowait()
+                except Empty:
+                    break
+            if batch:
+                self._send_batch(batch)
+            if item is None:
+                self._disconnect()
+                return
+
+    def _send_batch(self, batch: list) -> None:
+        packets = []
+        for queued_at, args in batch:
+            try:
+                packets.append((queued_at, str(build_code_packet(*args))))
+            except Exception:
+                logger.exception('Wrong verification code stanza')
+                increase_metric('failed')
+        if not packets:
+            return
+        data = ''.join(packet for queued_at, packet in packets)
+
+        # one retry with new connection, server could close idle connection
+        for attempt in range(2):
+            try:
+                self._connect().send(data)
+            except Exception:
+                logger.exception('Error sending verification codes, attempt %s', attempt + 1)
+                self._disconnect()
+                increase_metric('reconnects')
+                time.sleep(self.reconnect_delay)
+            else:
+                now = time.monotonic()
+                increase_metric('batches')
+                increase_metric('sent', len(packets))
+                increase_metric('latency_ms', int(sum(now - queued_at for queued_at, packet in packets) * 1000))
+                return
+
+        increase_metric('failed', len(packets))
+
+    def _connect(self):
+        if self._client is not None and self._client.isConnected():
+            return self._client
+
+        jid = xmpp.protocol.JID(self.jid)
+        client = self.client_factory(jid.getDomain())
+        if not client.connect():
+            raise ConnectionError('Error connecting to the XMPP server')
+        if not client.auth(jid.getNode(), self.password, resource=jid.getResource()):
+            raise ConnectionError('Authentication error on XMPP server')
+        self._client = client
+        return client
+
+    def _disconnect(self) -> None:
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.disconnect()
+            except Exception:
+                pass
+
+    def _ping(self) -> None:
+
+        """
+            Whitespace keepalive, broken connection is restored on next send.
+            Incoming stanzas (presences, iq, errors) are read and dropped, otherwise they fill socket buffers.
+        """
+
+        if self._client is not None:
+            try:
+                # 0 means closed connection
+                if not self._client.Process(0):
+                    raise ConnectionError('Connection closed')
+                self._client.send(' ')
+            except Exception:
+                self._disconnect()
+
+
+def get_xmpp_sender() -> XmppSender:
+    global _sender
+
+    with _sender_lock:
+        if _sender is None:
+            _sender = XmppSender(settings.XMPP_LOGIN, settings.XMPP_PASS)
+        return _sender
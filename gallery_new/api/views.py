@@ -5,29 +5,78 @@ from rest_framework.mixins import ListModelMixin
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.filters import OrderingFilter
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.authentication import SessionAuthentication
 from rest_framework.exceptions import PermissionDenied, NotFound
 
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.http import HttpResponseRedirect
+from django.utils import timezone
+from datetime import timedelta
 from xmpp.protocol import JID
 from uuid import uuid4
-from threading import Thread
 
-from .models import EntityFile, MediaFile, Quota, Token, VerificationCode
+from .models import EntityFile, MediaFile, Quota, Token, VerificationCode, UploadSession, Thumbnail, MediaFileChange
 from .serializers import FilesSerializer, FilesUploadSerializer, SlotSerializer, XmppAuthSerializer,\
-    TokensSerializer, AccountSerializer, XmppCodeSerializer, AvatarSerializer, AccountListSerializer
-from .backends import CustomFilterBackend, CustomPagination, CustomTokenAuth
-
-from .utils.other import is_blacklisted_or_not_whitelisted, send_code
-from .utils.generators import hash_md5, generate_code, get_title_from_path
-from .utils.thumbnails import create_thumbnails
-from .utils.responses import file_upload_response, get_quota_response, stats_response, serialize_data
-from .utils.exceptions import QuotaExceeded, NoFile, MailformedData
+    TokensSerializer, AccountSerializer, XmppCodeSerializer, AvatarSerializer, AccountListSerializer,\
+    UploadSessionSerializer
+from .backends import CustomFilterBackend, CustomPagination, CustomTokenAuth, IgnoreAcceptNegotiation,\
+    media_type_filter
+from .limit_size_fileupload_handler import get_declared_hash
+from .cache_quota import UserCacheQuota
+
+from .utils.other import is_blacklisted_or_not_whitelisted
+from .utils.xmpp_sender import get_xmpp_sender
+from .utils.generators import hash_md5, generate_code, get_title_from_path, get_symlink_url
+from .utils.jobs import enqueue
+from .utils.thumbnails import render_avatar_thumbnail, get_avatar_symlink_name, allow_avatar_render, has_thumbnails
+from .utils.deletion import delete_media_files
+from .utils.creation import create_media_files
+from .utils.downloads import sendfile_response
+from .utils.conditional import gallery_condition
+from .utils.uploads import StagedFile, create_staging_file, get_range_start, write_chunk, get_staging_hash,\
+    delete_staging_file
+from .utils.responses import file_upload_response, get_quota_response, stats_response, serialize_data,\
+    media_file_response
+from .utils.exceptions import QuotaExceeded, NoFile, MailformedData, TooManyRequests, LargeFileSize, WrongOffset,\
+    CursorExpired
 from .utils.validators import validate_name
 
 
+class MediaFileCreateMixin:
+
+    """ Create media file for uploaded original file """
+
+    def create_media_file(self, entity_file, is_avatar=False, avatar_thumbs=False, normalize=False, **fields):
+
+        # create media file and symlink
+        # Symlink creates and quota updates in signals
+        with transaction.atomic():
+            media_file = MediaFile.objects.create(
+                entity_file=entity_file,
+                user=self.request.user,
+                is_avatar=is_avatar,
+                avatar_thumbs=avatar_thumbs,
+                **fields
+            )
+
+        # Create thumbnails in background job. Required mimetypes: [image, video]
+        # Not normalized avatar is cropped by job before creating thumbnails
+        if normalize:
+            enqueue('normalize_avatar', media_file_id=media_file.id, avatar_thumbs=avatar_thumbs)
+        elif has_thumbnails(media_file.media_type):
+            enqueue(
+                'create_thumbnails',
+                media_file_id=media_file.id,
+                is_avatar=is_avatar,
+                avatar_thumbs=avatar_thumbs
+            )
+        return media_file
+
+
 class FilesView(ListModelMixin, GenericViewSet):
 
     """
@@ -49,25 +98,31 @@ class FilesView(ListModelMixin, GenericViewSet):
         'id',
         # name of provided param / queryset argument
         ('media_type', 'media_type__contains'),
+        ('media_type_prefix', media_type_filter),
         ('date_gte', 'created_at__gte'),
         ('date_lte', 'created_at__lte')
     ]
-    filter_required_parameters_DELETE = ['id', 'media_type', 'date_gte', 'date_lte']
+    filter_required_parameters_DELETE = ['id', 'media_type', 'media_type_prefix', 'date_gte', 'date_lte']
 
     filter_parameters = [
         'id',
+        # substring match is kept for compatibility, media_type_prefix is selected by index
         ('media_type', 'media_type__contains'),
+        ('media_type_prefix', media_type_filter),
         ('date_gte', 'created_at__gte'),
         ('date_lte', 'created_at__lte'),
         ('size_lte', 'size__lte'),
         ('size_gte', 'size__gte')
     ]
 
+    @gallery_condition
     def list(self, request, *args, **kwargs):
 
         """ Customized for filter files by user """
 
-        queryset = self.filter_queryset(self.get_queryset().filter(user=request.user))
+        queryset = self.filter_queryset(
+            self.get_queryset().filter(user=request.user).select_related('entity_file')
+        )
 
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -83,19 +138,68 @@ class FilesView(ListModelMixin, GenericViewSet):
         if path:
             # delete using file path
             title = get_title_from_path(path)
-            queryset = self.get_queryset().filter(title=title)
+            queryset = self.get_queryset().filter(user=request.user, title=title)
         else:
             # delete using filter backend
-            queryset = self.filter_queryset(self.get_queryset())
+            queryset = self.filter_queryset(self.get_queryset().filter(user=request.user))
 
-        if not queryset:
+        # Originals are deleted if they are not used by other media files
+        if not delete_media_files(queryset):
             raise NotFound({"status": status.HTTP_404_NOT_FOUND, "error": "Files does not exist"})
-
-        # Check deleting from storage in api/signals.py
-        queryset.delete()
         return Response('Files was delete', status.HTTP_204_NO_CONTENT)
 
 
+class FileChangesView(GenericAPIView):
+
+    """
+        Delta sync of media files list.
+        GET without since returns current cursor, client loads files list after that.
+        GET with since=<next_cursor> returns files created and ids of files deleted after cursor,
+        has_more is true if changes don't fit CHANGES_PAGE_SIZE.
+        Changes younger than CHANGES_SETTLE seconds are returned by next requests.
+        If changes after cursor were pruned, client should load files list again.
+    """
+
+    serializer_class = FilesSerializer
+    authentication_classes = [CustomTokenAuth, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        since = request.query_params.get('since')
+        if not since:
+            return Response({'created': [], 'deleted': [], 'next_cursor': str(MediaFileChange.get_settled_cursor()),
+                             'has_more': False})
+
+        try:
+            since = int(since)
+        except ValueError:
+            raise MailformedData
+        if MediaFileChange.is_expired(since):
+            raise CursorExpired
+
+        changes = list(
+            MediaFileChange.objects.filter(
+                user=request.user, is_avatar=False, id__gt=since, id__lte=MediaFileChange.get_settled_cursor()
+            ).order_by('id').values_list('id', 'media_file_id', 'action')[:settings.CHANGES_PAGE_SIZE + 1]
+        )
+        has_more = len(changes) > settings.CHANGES_PAGE_SIZE
+        changes = changes[:settings.CHANGES_PAGE_SIZE]
+
+        # the last action of every file, files created and deleted after cursor are returned as deleted
+        actions = {media_file_id: action for id, media_file_id, action in changes}
+        created = MediaFile.objects.filter(
+            user=request.user,
+            id__in=[media_file_id for media_file_id, action in actions.items() if action == MediaFileChange.CREATED]
+        ).select_related('entity_file').order_by('id')
+
+        return Response({
+            'created': self.get_serializer(created, many=True).data,
+            'deleted': [media_file_id for media_file_id, action in actions.items() if action == MediaFileChange.DELETED],
+            'next_cursor': str(changes[-1][0] if changes else since),
+            'has_more': has_more,
+        })
+
+
 class SlotView(GenericAPIView):
 
     """
@@ -124,17 +228,61 @@ class SlotView(GenericAPIView):
 
         if entity_file:
             # create new simlink
-            media_file = MediaFile.objects.create(
-                entity_file=entity_file,
-                user=request.user,
-                name=name
-            )
+            with transaction.atomic():
+                media_file = MediaFile.objects.create(
+                    entity_file=entity_file,
+                    user=request.user,
+                    name=name
+                )
             return Response(file_upload_response(media_file), status.HTTP_200_OK)
         else:
             return Response(get_quota_response(quota))
 
 
-class UploadFileView(CreateAPIView):
+class SlotBatchView(GenericAPIView):
+
+    """
+        Batch variant of slot request for many files in one request.
+        POST {"files": [{"hash": ..., "size": ..., "name": ...}, ...]}, not more than SLOT_BATCH_MAX_FILES.
+        Sizes of all files are checked against quota together,
+        media files are created for stored originals, hashes of not stored files are returned in missing.
+    """
+
+    http_method_names = ['post',]
+    authentication_classes = [CustomTokenAuth, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+    serializer_class = SlotSerializer
+
+    def post(self, request, *args, **kwargs):
+        files = request.data.get('files')
+        if not isinstance(files, list) or not files or len(files) > settings.SLOT_BATCH_MAX_FILES:
+            raise MailformedData
+
+        # validate data
+        files = serialize_data(self.get_serializer(data=files, many=True))
+
+        # all originals by one query
+        hashes = [file['hash'] for file in files]
+        entity_files = {entity_file.hash: entity_file for entity_file in EntityFile.objects.filter(hash__in=hashes)}
+
+        # check user quota
+        quota, created = Quota.objects.get_or_create(user=request.user)
+        if not quota.quota_available(sum(file['size'] for file in files)):
+            raise QuotaExceeded
+
+        media_files = create_media_files(request.user.id, [
+            (entity_files[file['hash']], file['name'])
+            for file in files if file['hash'] in entity_files
+        ])
+
+        quota.refresh_from_db(fields=['used'])
+        response = get_quota_response(quota)
+        response['created'] = [media_file_response(media_file) for media_file in media_files]
+        response['missing'] = [file_hash for file_hash in hashes if file_hash not in entity_files]
+        return Response(response)
+
+
+class UploadFileView(MediaFileCreateMixin, CreateAPIView):
 
     """ Customized to create multiple models on uploading file """
 
@@ -148,9 +296,15 @@ class UploadFileView(CreateAPIView):
 
         # validate data
         file = request.data.get('file', request.FILES.get('file'))
-        if not file:
+
+        # upload handler stops receiving if file with declared hash exists
+        entity_file = getattr(request, 'existing_entity_file', None)
+        if entity_file:
+            name = validate_name(request.existing_file_name)
+        elif file:
+            name = file.name = validate_name(file.name)
+        else:
             raise NoFile
-        file.name = validate_name(file.name)
         data = serialize_data(self.get_serializer(data=request.data))
 
         # variables
@@ -160,43 +314,205 @@ class UploadFileView(CreateAPIView):
         metadata = data.get('metadata', None)
         max_size = request.META.get('max_size', settings.MAX_AVATAR_SIZE)
         is_avatar = kwargs.get('is_avatar', False)
-        f = open(file.temporary_file_path(), 'rb')
-        file_hash = hash_md5(f)
-
-        # create or find original file
-        entity_file = EntityFile.objects.filter(hash=file_hash).first()
-        if not entity_file:
-            entity_file = EntityFile.objects.create(file=file, hash=file_hash)
 
-        # create media file and symlink
-        # Symlink creates in signals
-        media_file = MediaFile.objects.create(
-            entity_file=entity_file,
-            user=request.user,
-            metadata=metadata,
+        if entity_file:
+            # check user quota, file wasn't checked by upload handler
+            if not request.user.quota.quota_available(entity_file.file.size):
+                raise QuotaExceeded
+        else:
+            file_hash = getattr(file, 'hash', None)
+            if not file_hash:
+                # hash is computed on receiving in LimitSizeFileUploadHandler
+                file_hash = hash_md5(file)
+                file.seek(0)
+
+            declared_hash = get_declared_hash(request)
+            if declared_hash and declared_hash != file_hash and not is_avatar:
+                raise MailformedData
+
+            # create or find original file
+            entity_file = EntityFile.objects.filter(hash=file_hash).first()
+            if not entity_file:
+                entity_file = EntityFile.objects.create(file=file, hash=file_hash)
+
+        media_file = self.create_media_file(
+            entity_file,
             is_avatar=is_avatar,
             avatar_thumbs=avatar_thumbs,
+            normalize=is_avatar and request.META.get('avatar_crop', False),
+            metadata=metadata,
             media_type=media_type,
             size=size,
-            name=file.name
+            name=name
         )
 
-        # Create thumbnails using multithreading. Required mimetypes: [image, video]
-        Thread(
-            target=create_thumbnails,
-            args=(media_file,),
-            kwargs={
-                'is_avatar': is_avatar,
-                'avatar_thumbs': avatar_thumbs
-            }
-        ).start()
-
         return Response(
-            file_upload_response(media_file, is_avatar, avatar_thumbs, max_size),
+            file_upload_response(media_file, is_avatar, avatar_thumbs, max_size, request=request),
             status=status.HTTP_201_CREATED
         )
 
 
+class UploadSessionView(GenericAPIView):
+
+    """
+        Create resumable upload session.
+        Chunks are uploaded using UploadSessionDetailView
+    """
+
+    http_method_names = ['post',]
+    serializer_class = UploadSessionSerializer
+    authentication_classes = [CustomTokenAuth, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+
+        # validate data
+        data = serialize_data(self.get_serializer(data=request.data))
+
+        # variables
+        size = data.get('size')
+        quota, created = Quota.objects.get_or_create(user=request.user)
+
+        # check limits
+        if UserCacheQuota(request.user.username, quota.used).files_counter > settings.FILES_LIMIT:
+            raise TooManyRequests
+        if size > settings.MAX_RESUMABLE_FILE_SIZE:
+            raise LargeFileSize
+        if not quota.quota_available(size):
+            raise QuotaExceeded
+
+        session = UploadSession.objects.create(
+            user=request.user,
+            name=validate_name(data.get('name')),
+            media_type=data.get('media_type'),
+            size=size,
+            metadata=data.get('metadata'),
+            create_thumbnails=data.get('create_thumbnails', True)
+        )
+        create_staging_file(session)
+
+        return Response(self.get_serializer(session).data, status=status.HTTP_201_CREATED)
+
+
+class UploadSessionDetailView(GenericAPIView):
+
+    """
+        GET - current offset of upload session
+        PUT - upload chunk, request body is a part of file. Content-Range header is optional
+            Example: Content-Range: bytes 0-1048575/4194304
+        DELETE - cancel upload
+    """
+
+    http_method_names = ['get', 'put', 'delete']
+    serializer_class = UploadSessionSerializer
+    authentication_classes = [CustomTokenAuth, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self, finished=False):
+        expired = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_LIFETIME)
+        sessions = UploadSession.objects.filter(
+            session_id=self.kwargs.get('session_id'),
+            user=self.request.user,
+            updated_at__gte=expired
+        )
+        # finished session is available only for retried finish
+        session = (sessions if finished else sessions.filter(finished_at__isnull=True)).first()
+        if not session:
+            raise NotFound({'status': status.HTTP_404_NOT_FOUND, 'error': 'Upload session does not exist'})
+        return session
+
+    def get(self, request, *args, **kwargs):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def put(self, request, *args, **kwargs):
+        session = self.get_object()
+
+        try:
+            start = get_range_start(request.META.get('HTTP_CONTENT_RANGE'), session.offset)
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            raise MailformedData
+
+        if start != session.offset:
+            raise WrongOffset
+        if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+            raise LargeFileSize
+        if start + length > session.size:
+            raise MailformedData
+
+        with transaction.atomic():
+            # row lock, concurrent request for the same offset waits and gets WrongOffset
+            offset = UploadSession.objects.select_for_update().filter(id=session.id).values_list(
+                'offset', flat=True
+            ).first()
+            if offset != start:
+                raise WrongOffset
+
+            received = write_chunk(session, request.stream, start, length) if length else 0
+            UploadSession.objects.filter(id=session.id).update(offset=start + received, updated_at=timezone.now())
+
+        session.offset = start + received
+        return Response(self.get_serializer(session).data)
+
+    def delete(self, request, *args, **kwargs):
+
+        # Check deleting staging file in api/signals.py
+        self.get_object().delete()
+        return Response('Upload session was delete', status.HTTP_204_NO_CONTENT)
+
+
+class UploadSessionFinishView(MediaFileCreateMixin, UploadSessionDetailView):
+
+    """
+        Create media file when all chunks are uploaded.
+        Finish is idempotent: session row is locked, retried or concurrent request gets the created media file.
+    """
+
+    http_method_names = ['post',]
+
+    def post(self, request, *args, **kwargs):
+        with transaction.atomic():
+            session = UploadSession.objects.select_for_update().get(id=self.get_object(finished=True).id)
+
+            if session.finished_at:
+                media_file = MediaFile.objects.filter(id=session.media_file_id, user=request.user).first()
+                if not media_file:
+                    raise NotFound({'status': status.HTTP_404_NOT_FOUND, 'error': 'Upload session does not exist'})
+                return Response(file_upload_response(media_file, request=request), status=status.HTTP_200_OK)
+
+            if session.offset != session.size:
+                raise MailformedData
+
+            quota, created = Quota.objects.get_or_create(user=request.user)
+            if not quota.quota_available(session.size):
+                raise QuotaExceeded
+
+            # create or find original file
+            file_hash = get_staging_hash(session)
+            entity_file = EntityFile.objects.filter(hash=file_hash).first()
+            if not entity_file:
+                staging_file = StagedFile(open(session.get_staging_path(), 'rb'), session.name)
+                with staging_file:
+                    entity_file = EntityFile.objects.create(file=staging_file, hash=file_hash)
+
+            media_file = self.create_media_file(
+                entity_file,
+                avatar_thumbs=session.create_thumbnails,
+                metadata=session.metadata,
+                media_type=session.media_type,
+                size=session.size,
+                name=session.name
+            )
+
+            # session is deleted by purge_expired_sessions
+            session.finished_at = timezone.now()
+            session.media_file_id = media_file.id
+            session.save(update_fields=['finished_at', 'media_file_id', 'updated_at'])
+
+        delete_staging_file(session)
+        return Response(file_upload_response(media_file, request=request), status=status.HTTP_201_CREATED)
+
+
 class XmppCodeView(GenericAPIView):
 
     serializer_class = XmppCodeSerializer
@@ -223,14 +539,9 @@ class XmppCodeView(GenericAPIView):
         if is_blacklisted_or_not_whitelisted(resource, bare_jid):
             raise PermissionDenied({'status': status.HTTP_403_FORBIDDEN, 'error': 'Access denied'})
 
-        # send code using multithreading
-        Thread(
-            target=send_code,
-            args=(
-                settings.XMPP_LOGIN, settings.XMPP_PASS, code,
-                jid, stanza_id, stanza_type, confirm_url,
-            ),
-        ).start()
+        # code is sent by background sender through persistent connection
+        if not get_xmpp_sender().send_code(code, jid, stanza_id, stanza_type, confirm_url):
+            raise TooManyRequests
 
         # create verification code
         user, created = User.objects.get_or_create(username=bare_jid)
@@ -295,9 +606,9 @@ class QuotaView(APIView):
     authentication_classes = [CustomTokenAuth, SessionAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @gallery_condition
     def get(self, request, *args, **kwargs):
-        quota, created = Quota.objects.get_or_create(user=request.user)
-        return Response(get_quota_response(quota))
+        return Response(get_quota_response(request.user.quota))
 
     def put(self, request):
         value = request.data.get('value')
@@ -306,8 +617,7 @@ class QuotaView(APIView):
             raise MailformedData
 
         quota, created = Quota.objects.get_or_create(user=request.user)
-        quota.size = value
-        quota.save()
+        quota.update_quota_value(value)
         return Response(get_quota_response(quota))
 
 
@@ -353,6 +663,7 @@ class AccountView(GenericViewSet):
             except User.DoesNotExist:
                 raise NotFound({'status': status.HTTP_404_NOT_FOUND, 'error': 'Account does not exist'})
 
+        delete_media_files(MediaFile.objects.filter(user=user))
         user.delete()
         return Response('Account was delete', status.HTTP_204_NO_CONTENT)
 
@@ -366,11 +677,21 @@ class AvatarView(ListModelMixin, GenericViewSet):
     permission_classes = [IsAuthenticated]
     pagination_class = CustomPagination
 
+    @gallery_condition
     def list(self, request, *args, **kwargs):
 
         """ Customized for filter files by user """
 
-        queryset = self.filter_queryset(self.get_queryset().filter(user=request.user))
+        # load original files and avatar thumbnails for the whole page
+        queryset = self.filter_queryset(
+            self.get_queryset().filter(user=request.user).select_related('entity_file').prefetch_related(
+                Prefetch(
+                    'entity_file__thumbnail_set',
+                    queryset=Thumbnail.objects.filter(is_avatar=True).order_by('side_size'),
+                    to_attr='avatar_thumbnails'
+                )
+            )
+        )
 
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -395,12 +716,66 @@ class AvatarView(ListModelMixin, GenericViewSet):
         return Response('File was delete', status.HTTP_204_NO_CONTENT)
 
 
+class AvatarThumbnailView(APIView):
+
+    """
+        Lazy avatar thumbnail.
+        Size is rendered on first request, then request redirects to static file.
+    """
+
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request, slot_id, side_size, *args, **kwargs):
+        if side_size not in settings.THUMBS_SIZE_LIST:
+            raise NotFound({'status': status.HTTP_404_NOT_FOUND, 'error': 'Thumbnail does not exist'})
+
+        media_file = MediaFile.objects.select_related('entity_file').filter(
+            title=slot_id, is_avatar=True, avatar_thumbs=True
+        ).first()
+        thumbnail = media_file and media_file.entity_file.thumbnail_set.filter(
+            is_avatar=True, side_size=side_size
+        ).order_by('id').first()
+        if not thumbnail:
+            raise NotFound({'status': status.HTTP_404_NOT_FOUND, 'error': 'Thumbnail does not exist'})
+
+        if thumbnail.file:
+            Thumbnail.objects.filter(id=thumbnail.id).update(accessed_at=timezone.now())
+        elif allow_avatar_render(request.META.get('REMOTE_ADDR')):
+            render_avatar_thumbnail(media_file, thumbnail)
+        else:
+            raise TooManyRequests
+
+        return HttpResponseRedirect(get_symlink_url(media_file.title, get_avatar_symlink_name(media_file, side_size)))
+
+
+class FileDownloadView(APIView):
+
+    """
+        Download of own media file, transfer is handed off to front server according to SENDFILE_BACKEND.
+        Supports Range and conditional requests by ETag (hash of file) and Last-Modified.
+    """
+
+    authentication_classes = [CustomTokenAuth, SessionAuthentication]
+    permission_classes = [IsAuthenticated]
+    # Accept of client is for file, not for error renderers
+    content_negotiation_class = IgnoreAcceptNegotiation
+
+    def get(self, request, slot_id, name, *args, **kwargs):
+        media_file = MediaFile.objects.select_related('entity_file').filter(
+            user=request.user, title=slot_id, name=name
+        ).first()
+        if not media_file:
+            raise NotFound({'status': status.HTTP_404_NOT_FOUND, 'error': 'File does not exist'})
+
+        return sendfile_response(request, media_file)
+
+
 class StatsView(ListAPIView):
 
     authentication_classes = [CustomTokenAuth, SessionAuthentication]
     permission_classes = [IsAuthenticated]
 
+    @gallery_condition
     def get(self, request, *args, **kwargs):
-        user = request.user
-        media_files = MediaFile.objects.filter(user=user)
-        return Response(stats_response(media_files, user.quota.get_size))
+        return Response(stats_response(request.user))
@@ -87,7 +87,19 @@ STATIC_URL = '/static/'
 XMPP_LOGIN = ''
 XMPP_PASS = ''
 VERIFICATION_CODE_LIFETIME = 90
+XMPP_SENDER_QUEUE_SIZE = 1000  # Verification codes waiting for sending, over this limit requests get "Too many requests"
+XMPP_SENDER_BATCH_SIZE = 50
+XMPP_SENDER_RECONNECT_DELAY = 1
+XMPP_SENDER_KEEPALIVE = 60  # Seconds between whitespace pings of idle connection
 TOKEN_LIFETIME = 3600 * 24
+TOKENS_CACHE_TIMEOUT = 0  # Authenticated tokens are cached in Django cache, but not longer than token lifetime.
+# Requires shared cache backend (memcached, redis), ignored with LocMem cache. 0 disables
+TOKENS_LOCAL_CACHE_TIMEOUT = 5  # In-process cache can't be invalidated by other processes, keep it short
+TOKENS_LOCAL_CACHE_SIZE = 10000
+
+# -------- ASGI ---------#
+ASYNC_VIEWS = False  # Async variants of read endpoints for ASGI server: uvicorn gallery_new.asgi:application
+ASYNC_VIEWS_THREAD_SENSITIVE = False  # True runs views in one thread with other sync code (tests)
 
 # -------- DRF ---------#
 
@@ -108,6 +120,14 @@ FILE_UPLOAD_HANDLERS = [
 ]
 
 SYMLINKS_DIR = 'symlinks'
+# Directories of media files symlinks are sharded by 2 first characters of title on every level,
+# it changes urls of files, run check_symlinks --fix after changing
+SYMLINKS_SHARD_DEPTH = 0
+
+# Downloads through api/v1/files/download/: nginx (X-Accel-Redirect), apache (X-Sendfile) or django (streamed by Django)
+SENDFILE_BACKEND = 'django'
+SENDFILE_URL_PREFIX = '/protected/'  # nginx internal location with alias to MEDIA_ROOT
+SENDFILE_MAX_AGE = 3600
 
 # THUMBS
 THUMBNAIL_FILE_DIR = 'thumbnails'
@@ -115,6 +135,15 @@ DEFAULT_THUMB_SIZE = 256
 DEFAULT_THUMB_SIZE_TUPLE = DEFAULT_THUMB_SIZE if isinstance(DEFAULT_THUMB_SIZE, tuple) else (DEFAULT_THUMB_SIZE, DEFAULT_THUMB_SIZE)
 THUMBS_SIZE_LIST = (32, 48, 64, 96, 128, 192, 256, 384, 512, 768)
 MAX_AVATAR_SIZE = 1536
+VIDEO_THUMB_POSITION = 1  # Seconds. Video thumbnail is taken from the nearest keyframe before this position
+IMAGE_EXECUTOR = 'inline'  # Thumbnails rendering and avatar cropping: inline, thread or process (pool of IMAGE_WORKERS)
+IMAGE_WORKERS = 4
+IMAGE_QUEUE_SIZE = 16  # Tasks waiting for free worker. Over this limit task waits IMAGE_QUEUE_TIMEOUT seconds
+IMAGE_QUEUE_TIMEOUT = 5  # then request gets "Too many requests" error, job is retried later
+AVATAR_THUMBS_LAZY = True  # Avatar sizes are rendered on first request instead of upload
+AVATAR_THUMBS_CACHE_SIZE = 1000000000  # 1 GB. Least recently requested lazy avatar sizes are deleted over this size
+AVATAR_THUMBS_RENDER_LIMIT = 30  # Lazy sizes rendered for one client address per window, stored sizes are not limited
+AVATAR_THUMBS_RENDER_WINDOW = 60  # Seconds
 
 # QUOTA
 MAX_FILE_SIZE = 30000000  # 30 MB
@@ -122,3 +151,36 @@ DEFAULT_QUOTA_SIZE = 100000000  # 100 MB
 DEFAULT_QUOTA_OVERSIZE = 1000000  # 1 MB
 FILES_LIMIT = 10  # Limit the number of simultaneous file transfers
 TIME_WINDOW = 10  # Limit the frequency of file transfers: FILES_LIMIT per TIME_WINDOW
+SLOT_BATCH_MAX_FILES = 100  # Max files in one request of api/v1/files/slot/batch/
+
+# STATS
+STATS_CACHE_TIMEOUT = 3600  # Stats of user are cached until files changes with shared cache (memcached, redis). 0 disables cache
+STATS_LOCAL_CACHE_TIMEOUT = 10  # Timeout with LocMem cache, deleting on changes is not seen by other processes
+
+# CHANGES
+# Changes are returned after CHANGES_SETTLE seconds, it should be longer than any transaction writing them,
+# otherwise change committed later with smaller id can be missed by client
+CHANGES_SETTLE = 10
+CHANGES_PAGE_SIZE = 1000  # Max changes in one response of api/v1/files/changes/
+CHANGES_KEEP = 3600 * 24 * 30  # Changes are removed after this time by "manage.py prune_changes", clients with older cursor resync
+
+# RESUMABLE UPLOADS
+UPLOAD_SESSIONS_DIR = 'staging'
+MAX_RESUMABLE_FILE_SIZE = 1000000000  # 1 GB
+UPLOAD_CHUNK_MAX_SIZE = 10000000  # 10 MB
+UPLOAD_SESSION_LIFETIME = 3600 * 24  # Not finished uploads are removed after this time
+
+# GARBAGE COLLECTOR
+GC_GRACE_PERIOD = 3600 * 24  # Original file without media files is deleted after this time by "manage.py collect_garbage"
+GC_BATCH_SIZE = 500
+
+# JOBS
+JOBS_ASYNC = True  # Run jobs by "manage.py run_jobs" workers. If False jobs run immediately in web process
+JOBS_WORKERS = 4  # Max number of jobs running simultaneously in one worker process
+JOBS_POLL_INTERVAL = 1  # Seconds between checks of the queue
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_DELAY = 10  # Seconds before first retry, doubles with every attempt
+JOBS_RETRY_MAX_DELAY = 3600
+JOBS_TIMEOUT = 600  # Running job is returned to queue after timeout without heartbeat (killed worker)
+JOBS_HEARTBEAT = 60  # Seconds between updates of running job, should be less than JOBS_TIMEOUT
+JOBS_KEEP_DONE = 3600 * 24  # Done jobs are removed from database after this time